@@ -44,7 +44,7 @@ CREATE TABLE public.chat_history (
     role text NOT NULL,
     answer text NOT NULL,
     created_at timestamp without time zone DEFAULT now(),
-    CONSTRAINT chat_history_role_check CHECK ((role = ANY (ARRAY['user'::text, 'bot'::text])))
+    CONSTRAINT chat_history_role_check CHECK ((role = ANY (ARRAY['user'::text, 'assistant'::text, 'bot'::text])))
 );
 
 
@@ -91,9 +91,9 @@ ALTER TABLE public.langchain_pg_collection OWNER TO "user";
 
 CREATE TABLE public.langchain_pg_embedding (
     collection_id uuid,
-    embedding public.vector,
+    embedding public.vector(1536),
     document character varying,
-    cmetadata json,
+    cmetadata jsonb,
     custom_id character varying,
     uuid uuid NOT NULL
 );
@@ -167,6 +167,48 @@ ALTER TABLE ONLY public.langchain_pg_embedding
     ADD CONSTRAINT langchain_pg_embedding_pkey PRIMARY KEY (uuid);
 
 
+--
+-- Name: chat_history_session_id_idx; Type: INDEX; Schema: public; Owner: user
+--
+
+CREATE INDEX chat_history_session_id_idx ON public.chat_history USING btree (session_id, id);
+
+
+--
+-- Name: ix_langchain_pg_embedding_cmetadata_gin; Type: INDEX; Schema: public; Owner: user
+--
+
+CREATE INDEX ix_langchain_pg_embedding_cmetadata_gin ON public.langchain_pg_embedding USING gin (cmetadata jsonb_path_ops);
+
+
+--
+-- Name: ix_langchain_pg_embedding_collection_id; Type: INDEX; Schema: public; Owner: user
+--
+
+CREATE INDEX ix_langchain_pg_embedding_collection_id ON public.langchain_pg_embedding USING btree (collection_id);
+
+
+--
+-- Name: ix_langchain_pg_embedding_document_fts; Type: INDEX; Schema: public; Owner: user
+--
+
+CREATE INDEX ix_langchain_pg_embedding_document_fts ON public.langchain_pg_embedding USING gin (to_tsvector('english'::regconfig, document));
+
+
+--
+-- Name: ix_langchain_pg_embedding_embedding_hnsw; Type: INDEX; Schema: public; Owner: user
+--
+
+CREATE INDEX ix_langchain_pg_embedding_embedding_hnsw ON public.langchain_pg_embedding USING hnsw (embedding public.vector_cosine_ops) WITH (m='16', ef_construction='64');
+
+
+--
+-- Name: ix_langchain_pg_embedding_source; Type: INDEX; Schema: public; Owner: user
+--
+
+CREATE INDEX ix_langchain_pg_embedding_source ON public.langchain_pg_embedding USING btree (((cmetadata ->> 'source'::text)));
+
+
 --
 -- Name: langchain_pg_embedding langchain_pg_embedding_collection_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: user
 --
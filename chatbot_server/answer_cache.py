@@ -0,0 +1,225 @@
+# chatbot-server/answer_cache.py
+
+"""
+Semantic answer cache for rag_search_tool.
+
+An answer is reusable when a new question embeds close enough to a cached one
+(cosine similarity >= ANSWER_CACHE_SIMILARITY) *and* retrieval returned exactly
+the same chunks. Chunks are identified by content hash, so an entry can never be
+served once the text it was generated from has changed or disappeared.
+
+Two tiers:
+  • an in-process LRU with TTL, checked first
+  • a Postgres table shared by every worker, which synced_ingest invalidates by
+    source whenever a file is re-indexed or deleted
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import text
+
+from chatbot_server.vectorstore import get_engine
+from chatbot_server.tracing import record_cache
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))         # seconds
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))  # local tier, answers (all variants)
+ANSWER_CACHE_PG_MAX_ROWS = int(os.getenv("ANSWER_CACHE_PG_MAX_ROWS", "50000"))  # shared tier
+
+# Entries kept per distinct chunk set (different phrasings of the same question)
+_MAX_VARIANTS_PER_KEY = 8
+# Expired / excess rows are pruned from Postgres once every N stores
+_PG_PRUNE_EVERY = 100
+
+CACHE_TABLE = "rag_answer_cache"
+
+
+@dataclass
+class _Entry:
+    embedding: np.ndarray  # unit length
+    sources: frozenset
+    answer: str
+    created_at: float
+
+
+def chunk_set_key(chunk_ids: Iterable[str]) -> str:
+    """Order-independent key for the set of retrieved chunks."""
+    return hashlib.sha256("|".join(sorted(set(chunk_ids))).encode("utf-8")).hexdigest()
+
+
+def _unit(embedding: Sequence[float]) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def _vector_literal(embedding: Sequence[float]) -> str:
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+
+class SemanticAnswerCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local: "OrderedDict[str, list[_Entry]]" = OrderedDict()
+        self._local_count = 0  # entries over all keys, bounded by ANSWER_CACHE_MAX_ENTRIES
+        self._table_ready = False
+        self._stores = 0
+
+    # ── local tier ────────────────────────────────────────────────
+    def _local_lookup(self, key: str, query: np.ndarray) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entries = self._local.get(key)
+            if not entries:
+                return None
+            live = [e for e in entries if now - e.created_at < ANSWER_CACHE_TTL]
+            self._local_count -= len(entries) - len(live)
+            entries[:] = live
+            if not entries:
+                del self._local[key]
+                return None
+            best = max(entries, key=lambda e: float(e.embedding @ query))
+            if float(best.embedding @ query) < ANSWER_CACHE_SIMILARITY:
+                return None
+            self._local.move_to_end(key)
+            return best.answer
+
+    def _local_store(self, key: str, entry: _Entry) -> None:
+        with self._lock:
+            entries = self._local.setdefault(key, [])
+            entries.append(entry)
+            self._local_count += 1
+            if len(entries) > _MAX_VARIANTS_PER_KEY:
+                self._local_count -= len(entries) - _MAX_VARIANTS_PER_KEY
+                del entries[:-_MAX_VARIANTS_PER_KEY]
+            self._local.move_to_end(key)
+            # Evict least recently used keys (with all their variants) until the entry count fits
+            while self._local_count > ANSWER_CACHE_MAX_ENTRIES and len(self._local) > 1:
+                self._local_count -= len(self._local.popitem(last=False)[1])
+
+    # ── shared Postgres tier ──────────────────────────────────────
+    def _ensure_table(self) -> None:
+        if self._table_ready:
+            return
+        with get_engine().begin() as conn:
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+                    id              bigserial PRIMARY KEY,
+                    chunk_key       text        NOT NULL,
+                    sources         text[]      NOT NULL,
+                    query_embedding vector      NOT NULL,
+                    answer          text        NOT NULL,
+                    created_at      timestamptz NOT NULL DEFAULT now()
+                )
+            """))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {CACHE_TABLE}_chunk_key_idx ON {CACHE_TABLE} (chunk_key)"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {CACHE_TABLE}_sources_idx ON {CACHE_TABLE} USING gin (sources)"))
+        self._table_ready = True
+
+    def _pg_lookup(self, key: str, embedding: Sequence[float]) -> Optional[_Entry]:
+        self._ensure_table()
+        with get_engine().connect() as conn:
+            row = conn.execute(
+                text(f"""
+                    SELECT answer, sources, 1 - (query_embedding <=> :e) AS similarity,
+                           extract(epoch FROM created_at) AS created_at
+                    FROM {CACHE_TABLE}
+                    WHERE chunk_key = :k
+                      AND created_at > now() - make_interval(secs => :ttl)
+                    ORDER BY query_embedding <=> :e
+                    LIMIT 1
+                """),
+                {"e": _vector_literal(embedding), "k": key, "ttl": ANSWER_CACHE_TTL},
+            ).first()
+        if row is None or row.similarity < ANSWER_CACHE_SIMILARITY:
+            return None
+        return _Entry(_unit(embedding), frozenset(row.sources), row.answer, float(row.created_at))
+
+    def _pg_store(self, key: str, embedding: Sequence[float], sources: Sequence[str], answer: str) -> None:
+        self._ensure_table()
+        with get_engine().begin() as conn:
+            conn.execute(
+                text(f"""
+                    INSERT INTO {CACHE_TABLE} (chunk_key, sources, query_embedding, answer)
+                    VALUES (:k, :s, :e, :a)
+                """),
+                {"k": key, "s": list(sources), "e": _vector_literal(embedding), "a": answer},
+            )
+            self._stores += 1
+            if self._stores % _PG_PRUNE_EVERY == 0:
+                conn.execute(
+                    text(f"DELETE FROM {CACHE_TABLE} WHERE created_at < now() - make_interval(secs => :ttl)"),
+                    {"ttl": ANSWER_CACHE_TTL},
+                )
+                conn.execute(
+                    text(f"""
+                        DELETE FROM {CACHE_TABLE} WHERE id <= (
+                            SELECT id FROM {CACHE_TABLE} ORDER BY id DESC OFFSET :n LIMIT 1
+                        )
+                    """),
+                    {"n": ANSWER_CACHE_PG_MAX_ROWS},
+                )
+
+    # ── public API (synchronous; async callers use asyncio.to_thread) ──
+    def lookup(self, embedding: Sequence[float], chunk_ids: Iterable[str]) -> Optional[str]:
+        """Return a cached answer for a similar question over the same chunks, if any."""
+        if not ANSWER_CACHE_ENABLED:
+            return None
+        key = chunk_set_key(chunk_ids)
+        answer = self._local_lookup(key, _unit(embedding))
+        if answer is not None:
+            record_cache("answer", "local")
+            return answer
+        try:
+            entry = self._pg_lookup(key, embedding)
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+            entry = None
+        if entry is None:
+            record_cache("answer", "miss")
+            return None
+        record_cache("answer", "postgres")
+        self._local_store(key, entry)
+        return entry.answer
+
+    def store(self, embedding: Sequence[float], chunk_ids: Iterable[str], sources: Iterable[str], answer: str) -> None:
+        if not ANSWER_CACHE_ENABLED:
+            return
+        key = chunk_set_key(chunk_ids)
+        sources = sorted(set(sources))
+        self._local_store(key, _Entry(_unit(embedding), frozenset(sources), answer, time.time()))
+        try:
+            self._pg_store(key, embedding, sources, answer)
+        except Exception as e:
+            logger.warning(f"Answer cache store failed: {e}")
+
+    def invalidate_source(self, source: str) -> None:
+        """Drop every cached answer that was generated from chunks of `source`."""
+        with self._lock:
+            for key in list(self._local):
+                entries = [e for e in self._local[key] if source not in e.sources]
+                self._local_count -= len(self._local[key]) - len(entries)
+                if entries:
+                    self._local[key] = entries
+                else:
+                    del self._local[key]
+        try:
+            self._ensure_table()
+            with get_engine().begin() as conn:
+                conn.execute(text(f"DELETE FROM {CACHE_TABLE} WHERE :s = ANY(sources)"), {"s": source})
+        except Exception as e:
+            logger.warning(f"Answer cache invalidation failed for {source}: {e}")
+
+
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,157 @@
+# chatbot-server/catalog.py
+
+"""
+Document catalog: one row per indexed file.
+
+Kept up to date by the ingest paths (synced_ingest, ingest_docs) in the same
+transaction as the file's vectors, so document discovery (capability queries,
+reconcile) reads O(documents) rows instead of scanning langchain_pg_embedding.
+"""
+
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from chatbot_server.vectorstore import get_engine
+
+CATALOG_TABLE = "document_catalog"
+SUMMARY_CHARS = 200
+
+_lock = threading.Lock()
+_ready = False
+
+
+def file_hash(path: Path) -> str:
+    """sha256 of the file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ensure_catalog() -> None:
+    """Create the catalog table; on first creation, backfill it from the existing vectors."""
+    global _ready
+    if _ready:
+        return
+    with _lock:
+        if _ready:
+            return
+        with get_engine().begin() as conn:
+            existed = conn.execute(text("SELECT to_regclass(:t)"), {"t": CATALOG_TABLE}).scalar() is not None
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (
+                    source       text PRIMARY KEY,
+                    filename     text NOT NULL,
+                    mtime        double precision,
+                    content_hash text,
+                    chunk_count  integer NOT NULL,
+                    category     text,
+                    topic        text,
+                    summary      text,
+                    updated_at   timestamptz NOT NULL DEFAULT now()
+                )
+            """))
+            if not existed:
+                # mtime / hash stay NULL until the file is next ingested
+                conn.execute(text(f"""
+                    INSERT INTO {CATALOG_TABLE} (source, filename, chunk_count, category, topic, summary)
+                    SELECT cmetadata->>'source',
+                           regexp_replace(cmetadata->>'source', '^.*/', ''),
+                           count(*),
+                           max(cmetadata->>'category'),
+                           max(cmetadata->>'topic'),
+                           left(min(document), {SUMMARY_CHARS})
+                    FROM langchain_pg_embedding
+                    WHERE cmetadata->>'source' IS NOT NULL
+                    GROUP BY cmetadata->>'source'
+                    ON CONFLICT (source) DO NOTHING
+                """))
+        _ready = True
+
+
+def _summary(chunks: Sequence[Document]) -> str:
+    # A brief sample of the document's opening content
+    first = chunks[0].page_content if chunks else ""
+    return first[:SUMMARY_CHARS] + "..." if len(first) > SUMMARY_CHARS else first
+
+
+def upsert_document(conn: Connection, path: Path, chunks: Sequence[Document],
+                    content_hash: Optional[str] = None, mtime: Optional[float] = None) -> None:
+    """Record (or refresh) one indexed file. Runs on the caller's transaction."""
+    ensure_catalog()
+    metadata = chunks[0].metadata if chunks else {}
+    conn.execute(
+        text(f"""
+            INSERT INTO {CATALOG_TABLE}
+                (source, filename, mtime, content_hash, chunk_count, category, topic, summary, updated_at)
+            VALUES (:source, :filename, :mtime, :hash, :chunks, :category, :topic, :summary, now())
+            ON CONFLICT (source) DO UPDATE SET
+                filename = EXCLUDED.filename,
+                mtime = EXCLUDED.mtime,
+                content_hash = EXCLUDED.content_hash,
+                chunk_count = EXCLUDED.chunk_count,
+                category = EXCLUDED.category,
+                topic = EXCLUDED.topic,
+                summary = EXCLUDED.summary,
+                updated_at = now()
+        """),
+        {
+            "source": str(path),
+            "filename": path.name,
+            "mtime": mtime,
+            "hash": content_hash,
+            "chunks": len(chunks),
+            "category": metadata.get("category"),
+            "topic": metadata.get("topic"),
+            "summary": _summary(chunks),
+        },
+    )
+
+
+def touch_document(conn: Connection, path: Path, mtime: float) -> None:
+    """Record a new mtime for a file whose content (hash) did not change."""
+    ensure_catalog()
+    conn.execute(text(f"UPDATE {CATALOG_TABLE} SET mtime = :mtime WHERE source = :s"),
+                 {"mtime": mtime, "s": str(path)})
+
+
+def remove_document(conn: Connection, path: Path) -> None:
+    ensure_catalog()
+    conn.execute(text(f"DELETE FROM {CATALOG_TABLE} WHERE source = :s"), {"s": str(path)})
+
+
+def list_documents() -> List[Dict]:
+    """All catalogued documents, ordered by file name."""
+    ensure_catalog()
+    with get_engine().connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT source, filename, mtime, content_hash, chunk_count, category, topic, summary
+            FROM {CATALOG_TABLE}
+            ORDER BY filename
+        """)).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def get_document(source: str) -> Optional[Dict]:
+    ensure_catalog()
+    with get_engine().connect() as conn:
+        row = conn.execute(text(f"""
+            SELECT source, filename, mtime, content_hash, chunk_count
+            FROM {CATALOG_TABLE} WHERE source = :s
+        """), {"s": source}).mappings().first()
+    return dict(row) if row else None
+
+
+def document_states() -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+    """source → (mtime, content_hash) for every catalogued document."""
+    ensure_catalog()
+    with get_engine().connect() as conn:
+        rows = conn.execute(text(f"SELECT source, mtime, content_hash FROM {CATALOG_TABLE}")).all()
+    return {source: (mtime, content_hash) for source, mtime, content_hash in rows}
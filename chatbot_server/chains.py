@@ -7,20 +7,33 @@ from langchain.tools import StructuredTool
 from langchain.agents.openai_functions_agent.base import OpenAIFunctionsAgent
 from langchain.schema import SystemMessage
 from langchain.prompts import MessagesPlaceholder
-from chatbot_server.vectorstore import get_vectorstore, get_document_sources
+from chatbot_server.vectorstore import get_vectorstore, chunk_fingerprint
+from chatbot_server.catalog import list_documents
+from chatbot_server.answer_cache import answer_cache
+from chatbot_server.retrieval import hybrid_search
+from chatbot_server.session_memory import SessionMemoryStore
+from chatbot_server.tracing import TraceCollector, TokenUsageCallback, record_span, record_step, span
+from chatbot_server.db import init_pool, close_pool
+from chatbot_server.metrics import CHAT_OUTCOMES, CHAT_ROUTES
+from chatbot_server.intent_router import (
+    INTENT_ROUTER_EMBEDDINGS, INTENT_ROUTER_ENABLED, IntentRouter, Route,
+    ROUTE_AGENT, ROUTE_CAPABILITY, ROUTE_DOCUMENTS, ROUTE_EXCEL_READ, ROUTE_TEXT_READ,
+)
+from chatbot_server.tool_output import MAX_CELL_CHARS, format_schema, format_table
 from chatbot_server.excel_tools import (
     read_excel_file, update_excel_row, add_excel_row, 
-    delete_excel_row, delete_excel_record_by_criteria, get_excel_info as get_excel_info_from_tool
+    delete_excel_row, delete_excel_record_by_criteria, query_excel_rows, get_excel_info as get_excel_info_from_tool
 )
 from chatbot_server.text_tools import (
-    read_text_file, write_to_text_file, append_to_text_file, replace_in_text_file
+    load_text_file, read_text_file, write_to_text_file, append_to_text_file, replace_in_text_file
 )
 from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
-import json
-from typing import Dict, Any
-from contextlib import redirect_stdout
-import io
+from langchain_core.callbacks import BaseCallbackHandler
+from dataclasses import dataclass
+import asyncio
+import os
+import time
+from typing import Dict, Any, AsyncIterator, Awaitable, List, Optional
 import logging
 from pathlib import Path
 
@@ -31,59 +44,51 @@ logger = logging.getLogger(__name__)
 
 # === Global objects ===
 # These are initialized once and reused across requests.
-llm = ChatOpenAI(model="gpt-4-turbo", temperature=0, streaming=True)
-session_memory = {}  # Dictionary to hold memory for each session_id
+# stream_usage makes streamed responses report token counts as well
+llm = ChatOpenAI(model="gpt-4-turbo", temperature=0, streaming=True, stream_usage=True,
+                 callbacks=[TokenUsageCallback("gpt-4-turbo")])
+session_memory = SessionMemoryStore(llm)  # bounded, token-windowed, backed by chat_history
 
 # --- Tool Definitions ---
 # The underlying functions are now updated to accept structured arguments directly.
 # The tools are now defined as StructuredTools.
 
-def rag_search_tool(query: str) -> str:
-    """Use this to find answers and information from existing documents (like the US Constitution)."""
-    
-    # Check if this is a document capability query
-    capability_keywords = ["document filenames", "file types available", "brief content summary", "categories and topics covered"]
-    is_capability_query = any(keyword in query.lower() for keyword in capability_keywords)
-    
-    if is_capability_query:
-        # Get all document sources first
-        try:
-            sources = get_document_sources()
-            if not sources:
-                return "No documents found in the vector store."
-            
-            # Sample content from each document source
-            vectorstore = get_vectorstore()
-            document_summaries = []
-            
-            for source in sources:
-                # Get a sample of content from this specific document
-                docs = vectorstore.similarity_search("", k=20, filter={"source": f"/app/pdfs/{source}"})
-                if docs:
-                    # Get a brief sample of content from this document
-                    content_sample = docs[0].page_content[:200] + "..." if len(docs[0].page_content) > 200 else docs[0].page_content
-                    document_summaries.append(f"**{source}**: {content_sample}")
-            
-            return f"Available documents ({len(sources)} total):\n\n" + "\n\n".join(document_summaries)
-            
-        except Exception as e:
-            return f"Error retrieving document sources: {str(e)}"
-    
-    # === MULTI-STEP VERIFICATION PIPELINE ===
-    try:
-        # PHASE 1: Intelligent Search and Retrieval
-        vectorstore = get_vectorstore()
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-        retrieved_docs = retriever.get_relevant_documents(query)
-        
-        if not retrieved_docs:
-            return "I don't have that specific information in my knowledge base."
-        
-        # PHASE 2: Initial Response Generation
-        context = "\n\n".join([doc.page_content for doc in retrieved_docs])
-        
-        initial_prompt = PromptTemplate.from_template(
-            """You are an intelligent assistant. Answer the question using the provided context. Be comprehensive and helpful.
+# === Agent outcomes ===
+# run_chat_chain / stream_chat_chain report how the run ended so callers can
+# fall back to direct GPT on a decision, not by matching phrases in the answer.
+ANSWERED = "answered"      # the agent produced an answer
+NO_CONTEXT = "no_context"  # no document covers the question (nothing else for the agent to do)
+ERROR = "error"            # the agent run failed
+
+@dataclass
+class ChatResult:
+    response: str
+    outcome: str
+    seconds: float  # time spent in the agent run
+
+class NoContextError(Exception):
+    """Raised by _search_documents when retrieval has nothing relevant. On the
+    documents route it ends the request; the agent's tool returns NO_CONTEXT_ANSWER instead."""
+
+# Sentence the grounded prompts answer with when the context does not cover the question
+NO_CONTEXT_ANSWER = "I don't have that specific information in my knowledge base."
+
+def _is_no_context(answer: str) -> bool:
+    return answer.strip().strip('"').startswith(NO_CONTEXT_ANSWER)
+
+# === RAG pipeline ===
+# RAG_PIPELINE_MODE selects how much checking runs around the grounded answer:
+#   fast     - one context-only LLM call (the only output returned to the agent)
+#   verified - context-only answer plus the answer/fact/verification checks, run concurrently
+#   strict   - all four LLM calls in sequence (original behaviour)
+RAG_PIPELINE_MODES = ("fast", "verified", "strict")
+RAG_PIPELINE_MODE = os.getenv("RAG_PIPELINE_MODE", "fast").lower()
+if RAG_PIPELINE_MODE not in RAG_PIPELINE_MODES:
+    logger.warning(f"Unknown RAG_PIPELINE_MODE '{RAG_PIPELINE_MODE}', using 'fast'")
+    RAG_PIPELINE_MODE = "fast"
+
+initial_prompt = PromptTemplate.from_template(
+    """You are an intelligent assistant. Answer the question using the provided context. Be comprehensive and helpful.
 
 Context:
 {context}
@@ -91,37 +96,18 @@ Context:
 Question: {question}
 
 Answer:"""
-        )
-        
-        initial_chain = initial_prompt | llm
-        initial_response = initial_chain.invoke({"context": context, "question": query})
-        
-        # Extract content from LLM response
-        if hasattr(initial_response, 'content'):
-            initial_answer = initial_response.content
-        else:
-            initial_answer = str(initial_response)
-        
-        # PHASE 3: Fact Extraction and Verification
-        fact_extraction_prompt = PromptTemplate.from_template(
-            """Extract all factual claims from the following text. List each claim as a separate bullet point.
+)
+
+fact_extraction_prompt = PromptTemplate.from_template(
+    """Extract all factual claims from the following text. List each claim as a separate bullet point.
             
 Text: {text}
 
 Factual claims:"""
-        )
-        
-        fact_chain = fact_extraction_prompt | llm
-        fact_response = fact_chain.invoke({"text": initial_answer})
-        
-        if hasattr(fact_response, 'content'):
-            extracted_facts = fact_response.content
-        else:
-            extracted_facts = str(fact_response)
-        
-        # PHASE 4: Verification Against Retrieved Context
-        verification_prompt = PromptTemplate.from_template(
-            """Given the following context and a list of factual claims, determine which claims are supported by the context.
+)
+
+verification_prompt = PromptTemplate.from_template(
+    """Given the following context and a list of factual claims, determine which claims are supported by the context.
             
 Context:
 {context}
@@ -134,23 +120,11 @@ For each claim, respond with either:
 - REJECTED: [claim] - if the claim is not supported by the context
 
 Verification results:"""
-        )
-        
-        verification_chain = verification_prompt | llm
-        verification_response = verification_chain.invoke({
-            "context": context,
-            "claims": extracted_facts
-        })
-        
-        if hasattr(verification_response, 'content'):
-            verification_results = verification_response.content
-        else:
-            verification_results = str(verification_response)
-        
-        # PHASE 5: Strict Context-Only Response
-        # Skip the reconstruction phase entirely - use only direct context matching
-        context_only_prompt = PromptTemplate.from_template(
-            """Answer the question using ONLY the exact information provided in the Context below. 
+)
+
+# Skip the reconstruction phase entirely - use only direct context matching
+context_only_prompt = PromptTemplate.from_template(
+    """Answer the question using ONLY the exact information provided in the Context below. 
             
 STRICT RULES:
 - Use ONLY information that appears word-for-word in the Context
@@ -158,7 +132,7 @@ STRICT RULES:
 - Do NOT make logical inferences or fill in missing information
 - Do NOT use any knowledge outside the Context
 - If the Context doesn't contain a complete answer, say "Based on the available information:" and list only what's explicitly stated
-- If the Context is unrelated, say "I don't have that specific information in my knowledge base."
+- If the Context is unrelated, say "{no_context_answer}"
 
 Context:
 {context}
@@ -166,26 +140,160 @@ Context:
 Question: {question}
 
 Answer using only the exact information from the Context above:"""
+).partial(no_context_answer=NO_CONTEXT_ANSWER)
+
+def _content(response) -> str:
+    """Extract content from LLM response"""
+    if hasattr(response, 'content'):
+        return response.content
+    return str(response)
+
+async def _timed(timings: Dict[str, float], phase: str, coro: Awaitable[Any]) -> Any:
+    """Await coro and record its wall-clock duration under timings[phase] and as a rag.<phase> span."""
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[phase] = time.perf_counter() - start
+        record_span(f"rag.{phase}", timings[phase])
+
+async def _initial_answer_verification(context: str, query: str, timings: Dict[str, float]) -> str:
+    """PHASES 2-4: draft an answer, extract its factual claims and verify them against the context."""
+    # PHASE 2: Initial Response Generation
+    initial_answer = _content(await _timed(
+        timings, "initial_answer",
+        (initial_prompt | llm).ainvoke({"context": context, "question": query}),
+    ))
+
+    # PHASE 3: Fact Extraction and Verification
+    extracted_facts = _content(await _timed(
+        timings, "fact_extraction",
+        (fact_extraction_prompt | llm).ainvoke({"text": initial_answer}),
+    ))
+
+    # PHASE 4: Verification Against Retrieved Context
+    return _content(await _timed(
+        timings, "verification",
+        (verification_prompt | llm).ainvoke({"context": context, "claims": extracted_facts}),
+    ))
+
+async def _context_only_answer(context: str, query: str) -> str:
+    """PHASE 5: Strict Context-Only Response"""
+    return _content(await (context_only_prompt | llm).ainvoke({"question": query, "context": context}))
+
+def _log_verification(verification_results: str) -> None:
+    verified = verification_results.count("VERIFIED:")
+    rejected = verification_results.count("REJECTED:")
+    logger.info(f"RAG verification: {verified} claim(s) verified, {rejected} rejected")
+
+def _describe_documents() -> str:
+    """Build the document capability overview from the document catalog."""
+    documents = list_documents()
+    if not documents:
+        return "No documents found in the vector store."
+
+    document_summaries = []
+    for doc in documents:
+        label = f"**{doc['filename']}**"
+        if doc["topic"]:
+            label += f" ({doc['category']}: {doc['topic']})" if doc["category"] else f" ({doc['topic']})"
+        document_summaries.append(f"{label}: {doc['summary'] or ''}")
+
+    return f"Available documents ({len(documents)} total):\n\n" + "\n\n".join(document_summaries)
+
+def rag_search_tool(query: str) -> str:
+    """Synchronous entry point for arag_search_tool, used when the agent is invoked synchronously."""
+    return asyncio.run(arag_search_tool(query))
+
+async def arag_search_tool(query: str) -> str:
+    """Use this to find answers and information from existing documents (like the US Constitution)."""
+    try:
+        return await _search_documents(query)
+    except NoContextError:
+        # An empty search is one step of the agent run, not its end: the agent
+        # may still have Excel or text work to do, so it gets the sentence and carries on
+        record_step("no_context", query=query)
+        return NO_CONTEXT_ANSWER
+
+async def _search_documents(query: str, query_embedding: Optional[List[float]] = None) -> str:
+    """Grounded answer from the documents; raises NoContextError when they do not cover the query."""
+    
+    # Check if this is a document capability query
+    capability_keywords = ["document filenames", "file types available", "brief content summary", "categories and topics covered"]
+    is_capability_query = any(keyword in query.lower() for keyword in capability_keywords)
+    
+    if is_capability_query:
+        # The vector store client is synchronous, so keep it off the event loop
+        try:
+            return await asyncio.to_thread(_describe_documents)
+        except Exception as e:
+            return f"Error retrieving document sources: {str(e)}"
+    
+    # === MULTI-STEP VERIFICATION PIPELINE ===
+    try:
+        timings: Dict[str, float] = {}
+        mode = RAG_PIPELINE_MODE
+
+        # PHASE 1: Intelligent Search and Retrieval
+        # The query is embedded once and reused for both the search and the answer cache;
+        # retrieval fuses vector and full-text results so exact tokens are not missed
+        vectorstore = await asyncio.to_thread(get_vectorstore)
+        if query_embedding is None:  # the intent router may already have embedded the question
+            query_embedding = await _timed(timings, "embedding", vectorstore.embeddings.aembed_query(query))
+        retrieved_docs = await _timed(
+            timings, "retrieval", hybrid_search(vectorstore, query, query_embedding, k=5)
         )
         
-        context_only_chain = context_only_prompt | llm
-        final_response = context_only_chain.invoke({
-            "question": query,
-            "context": context
-        })
+        if not retrieved_docs:
+            # No chunk close enough to the question (RETRIEVAL_MAX_DISTANCE): skip the answer LLM calls
+            raise NoContextError(query)
+
+        chunk_ids = [chunk_fingerprint(doc) for doc in retrieved_docs]
+        cached_answer = await _timed(
+            timings, "answer_cache", asyncio.to_thread(answer_cache.lookup, query_embedding, chunk_ids)
+        )
+        if cached_answer is not None:
+            logger.info(f"RAG answer cache hit: {', '.join(f'{p}={t:.2f}s' for p, t in timings.items())}")
+            return cached_answer
         
-        if hasattr(final_response, 'content'):
-            return final_response.content
+        context = "\n\n".join([doc.page_content for doc in retrieved_docs])
+
+        if mode == "fast":
+            # One grounded call: the context-only answer is the only output we return
+            final_answer = await _timed(timings, "context_only_answer", _context_only_answer(context, query))
+        elif mode == "verified":
+            # The verification chain only depends on the context, so it runs
+            # alongside the context-only answer instead of in front of it
+            final_answer, verification_results = await asyncio.gather(
+                _timed(timings, "context_only_answer", _context_only_answer(context, query)),
+                _timed(timings, "verification_chain", _initial_answer_verification(context, query, timings)),
+            )
+            _log_verification(verification_results)
         else:
-            return str(final_response)
-            
+            # strict: every phase in sequence, as the pipeline was originally built
+            verification_results = await _initial_answer_verification(context, query, timings)
+            _log_verification(verification_results)
+            final_answer = await _timed(timings, "context_only_answer", _context_only_answer(context, query))
+
+        logger.info(
+            f"RAG pipeline ({mode}) timings: "
+            + ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in timings.items())
+        )
+        if _is_no_context(final_answer):
+            raise NoContextError(query)
+        sources = [str(doc.metadata.get("source", "")) for doc in retrieved_docs]
+        await asyncio.to_thread(answer_cache.store, query_embedding, chunk_ids, sources, final_answer)
+        return final_answer
+
+    except NoContextError:
+        raise
     except Exception as e:
         # Fallback to simple RAG if verification pipeline fails
         try:
-            vectorstore = get_vectorstore()
+            vectorstore = await asyncio.to_thread(get_vectorstore)
             retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
             fallback_prompt = PromptTemplate.from_template(
-                """Answer the question using only the provided context. If the context doesn't contain the answer, say "I don't have that specific information in my knowledge base."
+                """Answer the question using only the provided context. If the context doesn't contain the answer, say "{no_context_answer}"
 
 Context:
 {context}
@@ -193,27 +301,52 @@ Context:
 Question: {question}
 
 Answer:"""
-            )
+            ).partial(no_context_answer=NO_CONTEXT_ANSWER)
             chain = RetrievalQA.from_chain_type(llm=llm, retriever=retriever, chain_type_kwargs={"prompt": fallback_prompt})
-            return chain.run(query)
+            result = await chain.ainvoke({"query": query})
         except Exception as fallback_error:
             return f"Error retrieving information: {str(fallback_error)}"
+        if _is_no_context(result["result"]):
+            raise NoContextError(query)
+        return result["result"]
 
 def get_excel_schema(filename: str) -> str:
     """Use this tool to get the structure, columns, and sample data of an Excel file. This is the first step for any Excel operation to know what columns are available."""
     try:
-        return json.dumps(get_excel_info_from_tool(filename), indent=2)
+        return format_schema(get_excel_info_from_tool(filename))
     except Exception as e:
         return f"Error getting Excel info: {str(e)}"
 
-def read_excel_data(filename: str) -> str:
-    """Use this tool to read the current content of an Excel file."""
+def read_excel_data(filename: str, offset: int = 0, limit: int = 50) -> str:
+    """Use this tool to read the current content of an Excel file, one page of rows at a time (offset = first row_index to return). Rows come back tab-separated under a header line."""
     try:
-        result = read_excel_file(filename)
-        return f"File '{filename}' has {result['rows']} rows, columns: {result['columns']}. Data: {json.dumps(result['data'][:5], indent=2)}"
+        result = read_excel_file(filename, offset=offset, limit=limit)
+        return format_table(result["data"], ["row_index"] + result["columns"], result["rows"], offset,
+                            title=f"{filename} sheet {result['current_sheet']}")
     except Exception as e:
         return f"Error reading Excel file: {str(e)}"
 
+def query_excel_records(filename: str, equals: Optional[Dict[str, str]] = None, prefix: Optional[Dict[str, str]] = None,
+                        min_values: Optional[Dict[str, str]] = None, max_values: Optional[Dict[str, str]] = None,
+                        columns: Optional[List[str]] = None, limit: int = 20, offset: int = 0) -> str:
+    """Use this tool to FIND specific records in an Excel file. Filter by exact column values (equals), value prefixes (prefix) and numeric or text ranges (min_values / max_values, inclusive); optionally return only some columns. Matches come back tab-separated, each with its row_index for updates and deletes; use offset to page through more matches."""
+    try:
+        filters = (
+            [{"column": c, "op": "eq", "value": v} for c, v in (equals or {}).items()]
+            + [{"column": c, "op": "prefix", "value": v} for c, v in (prefix or {}).items()]
+            + [{"column": c, "op": "gte", "value": v} for c, v in (min_values or {}).items()]
+            + [{"column": c, "op": "lte", "value": v} for c, v in (max_values or {}).items()]
+        )
+        result = query_excel_rows(filename.strip(), filters, columns=columns, limit=limit, offset=offset)
+        if "error" in result:
+            return f"Error: {result['error']}"
+        records = result["records"]
+        shown_columns = ["row_index"] + (columns or [c for c in (records[0] if records else {}) if c != "row_index"])
+        return format_table(records, shown_columns, result["total_matches"], offset,
+                            title=f"{result['total_matches']} match(es) in sheet {result['sheet']}")
+    except Exception as e:
+        return f"An unexpected error occurred while querying records: {str(e)}"
+
 def add_new_excel_record(filename: str, order_number: str = "", part_number: str = "", order_details: str = "", price: str = "", seller: str = "", buyer: str = "", **kwargs) -> str:
     """Use this tool to CREATE a new record or add a new row to an Excel file. Provide filename and all the required Excel columns."""
     try:
@@ -316,12 +449,12 @@ def get_excel_info(filename: str) -> str:
     """Use this tool to get the schema of an Excel file, which can help with creating or updating records."""
     try:
         # This now correctly calls the imported function from excel_tools.py
-        return json.dumps(get_excel_info_from_tool(filename.strip()), indent=2)
+        return format_schema(get_excel_info_from_tool(filename.strip()))
     except Exception as e:
         return f"Error getting Excel info: {str(e)}"
 
 tools = [
-    Tool(name="find_document_information", func=rag_search_tool, description="Find answers from existing documents."),
+    Tool(name="find_document_information", func=rag_search_tool, coroutine=arag_search_tool, description="Find answers from existing documents."),
     StructuredTool.from_function(
         func=get_excel_schema,
         name="get_excel_schema",
@@ -330,7 +463,7 @@ tools = [
     StructuredTool.from_function(
         func=read_excel_data,
         name="read_excel_data",
-        description="Read data from an Excel file.",
+        description="Read data from an Excel file, a page of rows at a time (offset, limit).",
     ),
     StructuredTool.from_function(
         func=add_new_excel_record,
@@ -342,6 +475,11 @@ tools = [
         name="update_existing_excel_record",
         description="Update an existing record in an Excel file. Use this for modifying existing data.",
     ),
+    StructuredTool.from_function(
+        func=query_excel_records,
+        name="query_excel_records",
+        description="Find records in an Excel file by exact values, prefixes or ranges, returning only the matching rows (with row_index) and the requested columns.",
+    ),
     StructuredTool.from_function(
         func=delete_excel_record,
         name="delete_excel_record",
@@ -355,7 +493,7 @@ tools = [
     StructuredTool.from_function(
         func=read_text_file,
         name="read_text_file",
-        description="Read the entire content of a text file.",
+        description="Read a text file, a page of lines at a time (start_line).",
     ),
     StructuredTool.from_function(
         func=write_to_text_file,
@@ -403,9 +541,10 @@ system_message = SystemMessage(
 
         **Excel Operations Workflow**
         1.  **For Deletions**: Use `delete_excel_record_smart` with criteria like `{"Name": "Bob"}` instead of asking for row indices.
-        2.  **Gather Information**: Use `get_excel_schema` to see what columns are needed. Ask the user for any details missing from their request (e.g., `Order Number`, `Part Number`).
-        3.  **Execute**: Once you have all information, call the appropriate tool (`add_new_excel_record`, `update_existing_excel_record`, `delete_excel_record_smart`).
-        4.  **MANDATORY**: You MUST call the tool. Do NOT just say you will do it. Only confirm success AFTER the tool has been called and returned a success message.
+        2.  **Finding Records**: To look up records or find the row to update, use `query_excel_records` (e.g. `equals={"Order Number": "22"}`, `min_values={"Price": "1000"}`) instead of reading the whole file. Use the returned `row_index` with `update_existing_excel_record`.
+        3.  **Gather Information**: Use `get_excel_schema` to see what columns are needed. Ask the user for any details missing from their request (e.g., `Order Number`, `Part Number`).
+        4.  **Execute**: Once you have all information, call the appropriate tool (`add_new_excel_record`, `update_existing_excel_record`, `delete_excel_record_smart`).
+        5.  **MANDATORY**: You MUST call the tool. Do NOT just say you will do it. Only confirm success AFTER the tool has been called and returned a success message.
 
         **Text File Operations Workflow**
         1.  **Read and Analyze Format**: First, read the existing file to understand its current format and structure.
@@ -474,52 +613,281 @@ agent = OpenAIFunctionsAgent(llm=llm, tools=tools, prompt=prompt)
 
 # --- Main Agentic Chain ---
 
-def run_chat_chain(question: str, session_id: str = "default") -> str:
+# AgentExecutor holds no per-session state, so one instance serves every request
+# concurrently; the session's history is passed in with each call.
+# AGENT_VERBOSE=1 prints LangChain's verbose transcript for local debugging.
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE", "0") == "1"
+agent_executor = AgentExecutor(
+    agent=agent,
+    tools=tools,
+    verbose=AGENT_VERBOSE,
+    handle_parsing_errors=True,
+    max_iterations=15
+)
+
+async def _history(session_id: str) -> List[Any]:
+    """The session's recent messages. Memory is read-only here: turns are saved via
+    session_memory.save_turn() once the final (possibly fallback) response is known."""
+    memory = await session_memory.load(session_id)
+    return list(memory.buffer_as_messages)
+
+# === Intent routing ===
+# Requests the router classifies with confidence skip the agent (and its two LLM
+# round trips); see intent_router.py. INTENT_ROUTER_ENABLED=0 sends everything to the agent.
+intent_router = IntentRouter(
+    (lambda: get_vectorstore().embeddings) if INTENT_ROUTER_EMBEDDINGS else None
+)
+
+# Tool each direct route stands in for (reported in the streaming tool events)
+ROUTE_TOOLS = {
+    ROUTE_DOCUMENTS: "find_document_information",
+    ROUTE_CAPABILITY: "find_document_information",
+    ROUTE_EXCEL_READ: "read_excel_data",
+    ROUTE_TEXT_READ: "read_text_file",
+}
+
+async def _route(question: str, history: List[Any], session_id: str) -> Route:
+    if not INTENT_ROUTER_ENABLED:
+        return Route(ROUTE_AGENT, reason="router disabled")
+    with span("router"):
+        route = await intent_router.route(question, history)
+    logger.info(f"Routed question for session {session_id} to {route.route} ({route.reason})")
+    return route
+
+# How much of a file a direct read shows before pointing the user at follow-up requests
+DIRECT_READ_ROWS = 20
+DIRECT_READ_LINES = 60
+
+def _reply_cell(value: Any) -> str:
+    text = "" if value is None else " ".join(str(value).split())
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS] + "…"
+
+def _excel_reply(filename: str) -> Optional[str]:
+    """The first rows of a workbook, one record per line, or None if it cannot be read."""
+    try:
+        result = read_excel_file(filename, limit=DIRECT_READ_ROWS)
+    except Exception:
+        return None
+    columns, rows, total = result["columns"], result["data"], result["rows"]
+    if not rows:
+        return f"{filename} (sheet {result['current_sheet']}) has no rows yet."
+    # Rows are numbered by row_index, the number the update/delete tools take
+    lines = [f"Here are {len(rows)} of the {total} rows in {filename} (sheet {result['current_sheet']}):", ""]
+    lines += [f"Row {row['row_index']}: " + "; ".join(f"{c}: {_reply_cell(row.get(c))}" for c in columns)
+              for row in rows]
+    if total > len(rows):
+        lines += ["", f"{total - len(rows)} more rows. Ask for \"the next {DIRECT_READ_ROWS} rows of {filename}\", "
+                      f"or for the rows matching a value (e.g. a seller or an order number)."]
+    return "\n".join(lines)
+
+def _text_reply(filename: str) -> Optional[str]:
+    """The start of a text file, or None if it cannot be read."""
+    try:
+        lines = load_text_file(filename).splitlines()
+    except Exception:
+        return None
+    if not lines:
+        return f"{filename} is empty."
+    shown = lines[:DIRECT_READ_LINES]
+    reply = f"Here is {filename}:\n\n" + "\n".join(shown)
+    if len(lines) > len(shown):
+        reply += (f"\n\n(Lines 1-{len(shown)} of {len(lines)}. Ask for \"lines {len(shown) + 1}-{len(lines)} "
+                  f"of {filename}\" to see the rest.)")
+    return reply
+
+async def _answer_directly(route: Route, question: str) -> Optional[str]:
+    """
+    Answer a routed request without the agent. Raises NoContextError when the
+    documents do not cover the question; returns None if the route cannot serve
+    it after all (the caller then runs the agent).
+    """
+    if route.route not in ROUTE_TOOLS:
+        return None
+    # Timed under the same tool.* span the agent's callbacks record for this tool
+    with span(f"tool.{ROUTE_TOOLS[route.route]}"):
+        if route.route == ROUTE_DOCUMENTS:
+            return await _search_documents(question, query_embedding=route.embedding)
+        if route.route == ROUTE_CAPABILITY:
+            return await asyncio.to_thread(_describe_documents)
+        # None for an unknown or disallowed file: the agent sorts out which file was meant
+        if route.route == ROUTE_EXCEL_READ:
+            return await asyncio.to_thread(_excel_reply, route.filename)
+        return await asyncio.to_thread(_text_reply, route.filename)
+
+def _agent_outcome(trace: TraceCollector, output: str) -> str:
+    """NO_CONTEXT when the agent's searches found nothing and its answer says so, else ANSWERED."""
+    return NO_CONTEXT if trace.summary()["no_context"] and _is_no_context(output) else ANSWERED
+
+def _chat_result(trace: TraceCollector, outcome: str, response: str) -> ChatResult:
+    CHAT_OUTCOMES.labels(outcome=outcome).inc()
+    return ChatResult(response=response, outcome=outcome, seconds=trace.summary()["seconds"])
+
+async def run_chat_chain(question: str, session_id: str = "default") -> ChatResult:
     """
     Runs the chat chain for a given question and session ID.
-    Manages memory per session and captures agent's thought process.
+    The agent runs on the event loop via .ainvoke(), so a slow agent run does not
+    block other requests on the same worker.
     """
     logger.info(f"Received question for session {session_id}: {question}")
 
-    # Get or create memory for the given session
-    if session_id not in session_memory:
-        session_memory[session_id] = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-    memory = session_memory[session_id]
-    
-    # Create a new agent executor for each request to ensure memory is handled correctly
-    agent_executor = AgentExecutor(
-        agent=agent, 
-        tools=tools, 
-        memory=memory, 
-        verbose=True,
-        handle_parsing_errors=True,
-        max_iterations=15
-    )
-
+    trace = TraceCollector(session_id)
     try:
-        # Capture the verbose output from the agent's execution
-        string_io = io.StringIO()
-        with redirect_stdout(string_io):
-            # Use the modern .invoke() method, which is designed for correct memory handling.
-            # The deprecated .run() method does not reliably update the memory object.
-            result = agent_executor.invoke({"input": question})
-            response = result.get("output", "I'm sorry, I encountered an error.")
-        
-        thought_process = string_io.getvalue()
-        
-        # Log the captured thought process for analysis
-        logger.info("--- AGENT THOUGHT PROCESS ---")
-        logger.info(thought_process)
-        logger.info("-----------------------------")
-        
-        return response
+        history = await _history(session_id)
+        route = await _route(question, history, session_id)
+        if route.route != ROUTE_AGENT:
+            response = await _answer_directly(route, question)
+            if response is not None:
+                CHAT_ROUTES.labels(route=route.route).inc()
+                return _chat_result(trace, ANSWERED, response)
+        CHAT_ROUTES.labels(route=ROUTE_AGENT).inc()
+        inputs = {"input": question, "chat_history": history}
+        with span("agent"):
+            result = await agent_executor.ainvoke(inputs, config={"callbacks": [trace]})
+        output = result.get("output", "I'm sorry, I encountered an error.")
+        return _chat_result(trace, _agent_outcome(trace, output), output)
+    except NoContextError:
+        logger.info(f"No document context for session {session_id}")
+        return _chat_result(trace, NO_CONTEXT, NO_CONTEXT_ANSWER)
     except Exception as e:
         error_message = f"An unexpected error occurred: {str(e)}"
         logger.error(error_message)
-        return error_message
+        return _chat_result(trace, ERROR, error_message)
+    finally:
+        trace.log()
+
+
+# --- Streaming Agentic Chain ---
+
+class StreamingEventHandler(BaseCallbackHandler):
+    """
+    Forwards agent tokens and tool activity to an asyncio queue.
+
+    Synchronous tools run in worker threads, so events are handed to the event
+    loop with call_soon_threadsafe. Tokens produced while a tool is running (e.g.
+    the LLM calls inside rag_search_tool) are not forwarded: only the agent's own
+    output is streamed to the client.
+    """
+
+    # Called directly on the event loop instead of being dispatched to a thread per token
+    run_inline = True
+
+    def __init__(self, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        self.queue = queue
+        self.loop = loop
+        self.active_tools = 0
+
+    def _emit(self, event: str, data: Dict[str, Any]) -> None:
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, {"event": event, "data": data})
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if token and self.active_tools == 0:
+            self._emit("token", {"token": token})
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs) -> None:
+        self.active_tools += 1
+        self._emit("tool_start", {"tool": (serialized or {}).get("name", "tool"), "input": input_str})
+
+    def on_tool_end(self, output: Any, **kwargs) -> None:
+        self.active_tools = max(0, self.active_tools - 1)
+        self._emit("tool_end", {"tool": kwargs.get("name", "tool"), "output": str(output)[:500]})
+
+    def on_tool_error(self, error: BaseException, **kwargs) -> None:
+        self.active_tools = max(0, self.active_tools - 1)
+        if isinstance(error, NoContextError):
+            # Not a failure: the documents route ends here and the caller falls back to direct GPT
+            self._emit("tool_end", {"tool": kwargs.get("name", "tool"), "output": "No relevant documents found"})
+        else:
+            self._emit("tool_end", {"tool": kwargs.get("name", "tool"), "error": str(error)})
+
+
+async def stream_chat_chain(question: str, session_id: str = "default") -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs the chat chain and yields events as they happen.
+
+    Yields dicts of the form {"event": ..., "data": {...}} with events
+    "token", "tool_start", "tool_end" and finally "final" carrying the full
+    response, its outcome and the agent time (the fields of ChatResult).
+    """
+    logger.info(f"Received streaming question for session {session_id}: {question}")
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    handler = StreamingEventHandler(queue, loop)
+    trace = TraceCollector(session_id)
+
+    async def _run() -> str:
+        try:
+            history = await _history(session_id)
+            route = await _route(question, history, session_id)
+            if route.route != ROUTE_AGENT:
+                tool = ROUTE_TOOLS[route.route]
+                handler._emit("tool_start", {"tool": tool, "input": question})
+                try:
+                    response = await _answer_directly(route, question)
+                except NoContextError as e:
+                    handler.on_tool_error(e, name=tool)
+                    raise
+                if response is not None:
+                    handler._emit("tool_end", {"tool": tool, "output": response[:500]})
+                    CHAT_ROUTES.labels(route=route.route).inc()
+                    return response
+                handler._emit("tool_end", {"tool": tool, "output": "Handing over to the assistant"})
+            CHAT_ROUTES.labels(route=ROUTE_AGENT).inc()
+            inputs = {"input": question, "chat_history": history}
+            with span("agent"):
+                result = await agent_executor.ainvoke(inputs, config={"callbacks": [handler, trace]})
+            return result.get("output", "I'm sorry, I encountered an error.")
+        finally:
+            trace.log()
+
+    task = asyncio.ensure_future(_run())
+    queue_get: Optional[asyncio.Future] = None
+    try:
+        while True:
+            queue_get = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({queue_get, task}, return_when=asyncio.FIRST_COMPLETED)
+            if queue_get in done:
+                yield queue_get.result()
+                continue
+            queue_get.cancel()
+            break
+
+        # Drain events that arrived together with the end of the run
+        while not queue.empty():
+            yield queue.get_nowait()
+
+        try:
+            output = task.result()
+            result = _chat_result(trace, _agent_outcome(trace, output), output)
+        except NoContextError:
+            logger.info(f"No document context for session {session_id}")
+            result = _chat_result(trace, NO_CONTEXT, NO_CONTEXT_ANSWER)
+        except Exception as e:
+            error_message = f"An unexpected error occurred: {str(e)}"
+            logger.error(error_message)
+            result = _chat_result(trace, ERROR, error_message)
+
+        yield {"event": "final", "data": {"response": result.response, "outcome": result.outcome, "seconds": result.seconds}}
+    finally:
+        # The client went away (the generator was closed): stop the run instead of
+        # letting it keep spending LLM tokens and tool time for nobody
+        for pending in (queue_get, task):
+            if pending is not None and not pending.done():
+                pending.cancel()
+
+
+async def _demo() -> None:
+    await init_pool()
+    try:
+        for question in ("Can you add a record where Matt sold Tom an inflatable boat for $500?",
+                         "What is the price of the inflatable boat?"):
+            result = await run_chat_chain(question, "test_session")
+            await session_memory.save_turn("test_session", question, result.response)
+            print(f"[{result.outcome}] {result.response}")
+    finally:
+        await close_pool()
 
 
 if __name__ == '__main__':
     # Example usage (for debugging purposes)
-    print(run_chat_chain("Can you add a record where Matt sold Tom an inflatable boat for $500?", "test_session"))
-    print(run_chat_chain("What is the price of the inflatable boat?", "test_session"))
+    asyncio.run(_demo())
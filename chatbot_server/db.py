@@ -0,0 +1,311 @@
+# chatbot-server/db.py
+
+"""
+Chat history storage on an application-scoped asyncpg connection pool.
+
+The pool is created by the FastAPI lifespan hook (init_pool / close_pool) so
+every request reuses warm connections instead of paying a TCP + auth handshake
+per query. Pool size is bounded so traffic spikes queue for a connection
+rather than exhausting Postgres max_connections.
+
+chat_history is append-only on the request path: store_chat() hands turns to
+a HistoryWriter that inserts them in batches off the response path, and sessions
+are trimmed to their latest MAX_HISTORY_PROMPTS pairs by a periodic job rather
+than by a delete per turn. Every query walks the (session_id, id) index, so
+its cost does not grow with the size of the table (see manage_db migrate).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import asyncpg
+from dotenv import load_dotenv
+
+from chatbot_server.metrics import (
+    DB_POOL_ACQUIRE_SECONDS,
+    DB_POOL_CONNECTIONS_IN_USE,
+    DB_POOL_CONNECTIONS_MAX,
+    DB_POOL_CONNECTIONS_OPEN,
+)
+from chatbot_server.tracing import span
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# === Config ===
+MAX_HISTORY_PROMPTS = 20  # each prompt = 1 user + 1 bot entry
+HISTORY_BATCH_MAX = int(os.getenv("CHAT_HISTORY_BATCH_MAX", "100"))               # turns per INSERT
+HISTORY_BATCH_WINDOW = float(os.getenv("CHAT_HISTORY_BATCH_WINDOW", "0.05"))      # seconds to gather a batch
+HISTORY_TRIM_INTERVAL = float(os.getenv("CHAT_HISTORY_TRIM_INTERVAL", "300"))     # seconds between trims
+
+DB_HOST = os.getenv("POSTGRES_HOST", "postgres")
+DB_PORT = int(os.getenv("POSTGRES_PORT", "5432"))
+DB_NAME = os.getenv("POSTGRES_DB", "chatbot_db")
+DB_USER = os.getenv("POSTGRES_USER", "user")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "securepass123")
+
+POOL_MIN_SIZE = int(os.getenv("CHAT_DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("CHAT_DB_POOL_MAX_SIZE", "10"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("CHAT_DB_POOL_ACQUIRE_TIMEOUT", "10"))
+# Idle connections above min size are closed after this many seconds
+POOL_MAX_IDLE = float(os.getenv("CHAT_DB_POOL_MAX_IDLE", "300"))
+
+_pool: Optional[asyncpg.Pool] = None
+
+
+def _in_use() -> int:
+    if _pool is None:
+        return 0
+    return _pool.get_size() - _pool.get_idle_size()
+
+
+DB_POOL_CONNECTIONS_OPEN.set_function(lambda: _pool.get_size() if _pool is not None else 0)
+DB_POOL_CONNECTIONS_IN_USE.set_function(_in_use)
+
+
+async def init_pool() -> asyncpg.Pool:
+    """Create the connection pool. Called once from the FastAPI lifespan hook."""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=DB_HOST,
+            port=DB_PORT,
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=POOL_MAX_IDLE,
+        )
+        DB_POOL_CONNECTIONS_MAX.set(POOL_MAX_SIZE)
+        logger.info(f"Chat history pool ready (min={POOL_MIN_SIZE}, max={POOL_MAX_SIZE})")
+    return _pool
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+@asynccontextmanager
+async def acquire() -> AsyncIterator[asyncpg.Connection]:
+    """Check a connection out of the pool, recording how long the wait took."""
+    if _pool is None:
+        raise RuntimeError("Chat history pool is not initialized; call init_pool() first.")
+    start = time.perf_counter()
+    async with _pool.acquire(timeout=POOL_ACQUIRE_TIMEOUT) as conn:
+        DB_POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - start)
+        yield conn
+
+
+async def check_health() -> Dict[str, object]:
+    """Round-trip a trivial query and report pool usage."""
+    start = time.perf_counter()
+    async with acquire() as conn:
+        await conn.fetchval("SELECT 1")
+    return {
+        "status": "ok",
+        "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+        "pool": {
+            "size": _pool.get_size(),
+            "in_use": _in_use(),
+            "idle": _pool.get_idle_size(),
+            "min_size": POOL_MIN_SIZE,
+            "max_size": POOL_MAX_SIZE,
+        },
+    }
+
+
+async def _insert_turns(turns: List[Tuple[str, str, str]]) -> List[List[int]]:
+    """Insert (session_id, question, answer) turns in one statement; returns the row ids per turn."""
+    sessions, roles, answers = [], [], []
+    for session_id, question, answer in turns:
+        sessions += [session_id, session_id]
+        roles += ["user", "assistant"]
+        answers += [question, answer]
+    async with acquire() as conn:
+        async with conn.transaction():
+            # Ids drawn up front (ascending), so each turn knows its rows and the user row sorts first
+            ids = [r[0] for r in await conn.fetch(
+                "SELECT nextval(pg_get_serial_sequence('chat_history', 'id')) FROM generate_series(1, $1)",
+                len(answers),
+            )]
+            await conn.execute(
+                """
+                INSERT INTO chat_history (id, session_id, role, answer)
+                SELECT * FROM unnest($1::int[], $2::text[], $3::text[], $4::text[])
+                """,
+                ids, sessions, roles, answers
+            )
+    return [ids[i:i + 2] for i in range(0, len(ids), 2)]
+
+
+async def trim_history(session_ids: List[str], keep: int = MAX_HISTORY_PROMPTS * 2) -> int:
+    """Delete all but the latest `keep` rows of each session; returns the number of rows deleted."""
+    if not session_ids:
+        return 0
+    with span("db.trim_history"):
+        async with acquire() as conn:
+            # One index probe per session finds its cutoff id; sessions under the limit have none
+            result = await conn.execute(
+                """
+                DELETE FROM chat_history h
+                USING (
+                    SELECT s.session_id,
+                           (SELECT id FROM chat_history c
+                            WHERE c.session_id = s.session_id
+                            ORDER BY id DESC OFFSET $2 LIMIT 1) AS cutoff
+                    FROM unnest($1::text[]) AS s(session_id)
+                ) t
+                WHERE h.session_id = t.session_id AND h.id <= t.cutoff
+                """,
+                session_ids, keep
+            )
+    return int(result.split()[-1])
+
+
+class HistoryWriter:
+    """
+    Batches chat_history inserts and trims the sessions it wrote to.
+
+    submit() queues a turn and returns a future for its row ids; a background
+    task writes everything queued within HISTORY_BATCH_WINDOW in one INSERT.
+    Sessions written since the last trim are trimmed every HISTORY_TRIM_INTERVAL
+    seconds and on stop().
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._written: Set[str] = set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._write_loop()), asyncio.create_task(self._trim_loop())]
+
+    async def stop(self) -> None:
+        """Write whatever is queued, trim, and stop the background tasks."""
+        if not self.running:
+            return
+        writer, trimmer = self._tasks
+        self._queue.put_nowait(None)  # the writer exits once everything before it is written
+        await writer
+        trimmer.cancel()
+        await asyncio.gather(trimmer, return_exceptions=True)
+        self._tasks = []
+        await self._trim()
+
+    def submit(self, session_id: str, question: str, answer: str) -> "asyncio.Future[List[int]]":
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((session_id, question, answer, future))
+        return future
+
+    def _drain(self) -> List[tuple]:
+        batch = []
+        while not self._queue.empty() and len(batch) < HISTORY_BATCH_MAX:
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _write_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            if batch[0] is not None:
+                await asyncio.sleep(HISTORY_BATCH_WINDOW)
+            batch += self._drain()
+            stopping = None in batch
+            batch = [turn for turn in batch if turn is not None]
+            if batch:
+                await self._write_batch(batch)
+
+    async def _write_batch(self, batch: List[tuple]) -> None:
+        try:
+            with span("db.store_chat"):
+                row_ids = await _insert_turns([(s, q, a) for s, q, a, _ in batch])
+        except Exception as e:
+            logger.error(f"Could not store {len(batch)} chat turn(s): {e}")
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (session_id, *_, future), ids in zip(batch, row_ids):
+            self._written.add(session_id)
+            if not future.done():
+                future.set_result(ids)
+
+    async def _trim_loop(self) -> None:
+        while True:
+            await asyncio.sleep(HISTORY_TRIM_INTERVAL)
+            await self._trim()
+
+    async def _trim(self) -> None:
+        sessions, self._written = list(self._written), set()
+        try:
+            deleted = await trim_history(sessions)
+            if deleted:
+                logger.info(f"Trimmed {deleted} chat history row(s) across {len(sessions)} session(s)")
+        except Exception as e:
+            logger.warning(f"Chat history trim failed, retrying next interval: {e}")
+            self._written.update(sessions)
+
+
+history_writer = HistoryWriter()
+
+
+async def store_chat(session_id: str, question: str, answer: str) -> List[int]:
+    """Append one question/answer pair; returns the ids of the two rows."""
+    if history_writer.running:
+        return await history_writer.submit(session_id, question, answer)
+    # No writer (scripts, tests): write and trim inline
+    with span("db.store_chat"):
+        ids = (await _insert_turns([(session_id, question, answer)]))[0]
+    await trim_history([session_id])
+    return ids
+
+
+async def fetch_history_rows(session_id: str, after_id: int = 0) -> List[asyncpg.Record]:
+    """Latest rows of a session with id > after_id (id, role, answer), oldest first."""
+    with span("db.load_history"):
+        async with acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT id, role, answer FROM (
+                    SELECT id, role, answer
+                    FROM chat_history
+                    WHERE session_id = $1 AND id > $2
+                    ORDER BY id DESC
+                    LIMIT $3
+                ) AS latest
+                ORDER BY id ASC
+                """,
+                session_id, after_id, MAX_HISTORY_PROMPTS * 2
+            )
+
+
+async def fetch_history(session_id: str) -> List[Dict[str, str]]:
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT role, answer
+            FROM chat_history
+            WHERE session_id = $1
+            ORDER BY id DESC
+            LIMIT $2
+            """,
+            session_id, MAX_HISTORY_PROMPTS * 2
+        )
+        # Latest rows, oldest first (the table may briefly hold more until the next trim)
+        return [{"role": r["role"], "answer": r["answer"]} for r in reversed(rows)]
@@ -0,0 +1,176 @@
+# chatbot-server/embedding_cache.py
+
+"""
+Content-hash → vector cache in front of the embeddings API.
+
+CachedEmbeddings wraps any LangChain Embeddings object. Each text is keyed by
+sha256(model + text); hits are served from a small in-process LRU and then from
+the embedding_cache table, and only the misses are sent to the API (in one
+batch). Used by the vector store for both queries and ingest, so unchanged
+chunks and repeated questions are never embedded twice.
+
+The table is bounded to EMBEDDING_CACHE_MAX_ROWS, evicting the least recently
+used vectors.
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import text
+
+from chatbot_server.tracing import record_cache
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "200000"))
+EMBEDDING_CACHE_LOCAL_MAX = int(os.getenv("EMBEDDING_CACHE_LOCAL_MAX", "2048"))
+
+CACHE_TABLE = "embedding_cache"
+# The table is pruned back to EMBEDDING_CACHE_MAX_ROWS once every N inserted vectors
+_PRUNE_EVERY = 1000
+
+
+def _vector_literal(embedding: Sequence[float]) -> str:
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, underlying: Embeddings, engine_factory, model_name: str = ""):
+        """
+        Args:
+            underlying: Embeddings used for cache misses
+            engine_factory: callable returning the SQLAlchemy engine for the cache table
+            model_name: part of the cache key, so switching models never reuses vectors
+        """
+        self.underlying = underlying
+        self._engine_factory = engine_factory
+        self.model_name = model_name or getattr(underlying, "model", "")
+        self._lock = threading.Lock()
+        self._local: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._table_ready = False
+        self._inserted = 0
+
+    def content_hash(self, text_: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text_}".encode("utf-8")).hexdigest()
+
+    # ── storage ───────────────────────────────────────────────────
+    def _ensure_table(self, conn) -> None:
+        if self._table_ready:
+            return
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+                content_hash text        PRIMARY KEY,
+                embedding    vector      NOT NULL,
+                last_used    timestamptz NOT NULL DEFAULT now()
+            )
+        """))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {CACHE_TABLE}_last_used_idx ON {CACHE_TABLE} (last_used)"))
+        self._table_ready = True
+
+    def _remember(self, vectors: Dict[str, List[float]]) -> None:
+        with self._lock:
+            for key, vec in vectors.items():
+                self._local[key] = vec
+                self._local.move_to_end(key)
+            while len(self._local) > EMBEDDING_CACHE_LOCAL_MAX:
+                self._local.popitem(last=False)
+
+    def _load(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._local:
+                    self._local.move_to_end(key)
+                    found[key] = self._local[key]
+        remaining = [k for k in keys if k not in found]
+        if not remaining:
+            return found
+        with self._engine_factory().begin() as conn:
+            self._ensure_table(conn)
+            rows = conn.execute(
+                text(f"SELECT content_hash, embedding::text FROM {CACHE_TABLE} WHERE content_hash = ANY(:h)"),
+                {"h": remaining},
+            ).all()
+            if rows:
+                # Refresh recency at most once a day per vector to keep hits read-mostly
+                conn.execute(
+                    text(f"""
+                        UPDATE {CACHE_TABLE} SET last_used = now()
+                        WHERE content_hash = ANY(:h) AND last_used < now() - interval '1 day'
+                    """),
+                    {"h": [r[0] for r in rows]},
+                )
+        from_db = {key: [float(x) for x in json.loads(vec)] for key, vec in rows}
+        self._remember(from_db)
+        found.update(from_db)
+        return found
+
+    def _save(self, vectors: Dict[str, List[float]]) -> None:
+        self._remember(vectors)
+        with self._engine_factory().begin() as conn:
+            self._ensure_table(conn)
+            conn.execute(
+                text(f"""
+                    INSERT INTO {CACHE_TABLE} (content_hash, embedding)
+                    VALUES (:h, :e)
+                    ON CONFLICT (content_hash) DO NOTHING
+                """),
+                [{"h": key, "e": _vector_literal(vec)} for key, vec in vectors.items()],
+            )
+            before = self._inserted
+            self._inserted += len(vectors)
+            if self._inserted // _PRUNE_EVERY != before // _PRUNE_EVERY:
+                conn.execute(
+                    text(f"""
+                        DELETE FROM {CACHE_TABLE} WHERE content_hash IN (
+                            SELECT content_hash FROM {CACHE_TABLE}
+                            ORDER BY last_used DESC OFFSET :n
+                        )
+                    """),
+                    {"n": EMBEDDING_CACHE_MAX_ROWS},
+                )
+
+    # ── Embeddings interface ──────────────────────────────────────
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not EMBEDDING_CACHE_ENABLED or not texts:
+            return self.underlying.embed_documents(texts)
+
+        keys = [self.content_hash(t) for t in texts]
+        try:
+            cached = self._load(list(dict.fromkeys(keys)))
+        except Exception as e:
+            logger.warning(f"Embedding cache read failed: {e}")
+            cached = {}
+
+        # Embed each distinct missing text once
+        missing = {key: t for key, t in zip(keys, texts) if key not in cached}
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            try:
+                self._save(fresh)
+            except Exception as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+            cached.update(fresh)
+
+        logger.debug(f"Embedding cache: {len(texts) - len(missing)} hit(s), {len(missing)} miss(es)")
+        record_cache("embedding", "hit", len(texts) - len(missing))
+        record_cache("embedding", "miss", len(missing))
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text_: str) -> List[float]:
+        return self.embed_documents([text_])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text_: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, text_)
@@ -0,0 +1,582 @@
+# chatbot-server/excel_engine.py
+
+"""
+In-memory table engine behind the Excel tools.
+
+Each workbook is read once into per-sheet DataFrames (all cells as strings,
+blanks as "") and served from memory afterwards.
+
+Updates and deletes (by position or by criteria) are only meaningful against
+the exact rows the caller saw: replayed later on a file another worker has
+since changed, they would hit different rows than the ones reported back. So
+they run write-through: the whole refresh → validate → apply → write sequence
+holds the workbook's exclusive file_lock, and the change is on disk before the
+tool call returns. They are never journaled or replayed.
+
+Appends do not depend on existing rows, so they are persisted write-behind:
+
+  1. the operation is appended to the workbook's journal and fsync'd
+     (the change is durable once the tool call returns)
+  2. the cached DataFrame is updated in place
+  3. a background flusher rewrites the .xlsx EXCEL_FLUSH_DELAY seconds later,
+     so a burst of edits is group-committed in one workbook write; the file is
+     written to a temp file and renamed over the original, then the journal is
+     cleared. EXCEL_FLUSH_DELAY=0 writes these through synchronously as well.
+
+Loads take a shared and flushes an exclusive file_lock on the workbook, so
+uvicorn workers sharing a file never interleave a read-modify-write: a flush
+first folds in whatever another process wrote, then writes. Each process keeps
+its own journal (<workbook>.<pid>.journal); journals left by dead processes are
+adopted and replayed by the next process that loads the workbook.
+
+Journaled ops carry an id (journal owner, sequence number), and every write
+stores the highest id applied per owner in the workbook itself, as a custom
+document property written by the same atomic rename. A crash between writing
+the workbook and clearing the journal therefore does not apply an append
+twice: replay skips ops at or below the recorded id. A journaled
+operation that can no longer be applied (its sheet was removed by an outside
+edit, or an update/delete journaled by an older version) is moved to
+<journal>.rejected and logged as an error rather than lost.
+
+Key columns (EXCEL_INDEXED_COLUMNS) get hash indexes mapping a lower-cased
+cell value to its row positions. They are built on first use and kept current
+by updates and appends. Deletes shift row positions, so a delete drops the
+indexes of that sheet and the next lookup rebuilds them. Criteria matching
+and query() use them for equality filters and touch only the candidate rows.
+
+Before every access the file's mtime/size are compared with what was loaded
+or last written. An outside edit (someone saving the workbook in Excel) is
+reloaded, and any journaled operations not yet flushed are replayed on top
+of it. On startup a leftover journal (crash before flush) is replayed the same
+way.
+"""
+
+import io
+import os
+import glob
+import json
+import time
+import uuid
+import zipfile
+import atexit
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+from openpyxl.packaging.custom import StringProperty
+
+from chatbot_server.file_locks import atomic_write, file_lock
+from chatbot_server.tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+EXCEL_FLUSH_DELAY = float(os.getenv("EXCEL_FLUSH_DELAY", "0.5"))  # seconds
+EXCEL_JOURNAL_DIR = os.getenv("EXCEL_JOURNAL_DIR", "/app/excel_journal")
+EXCEL_INDEXED_COLUMNS = [
+    c.strip() for c in os.getenv("EXCEL_INDEXED_COLUMNS", "Order Number,Part Number,Seller,Buyer").split(",") if c.strip()
+]
+
+# query() filter operators
+FILTER_OPS = ("eq", "prefix", "gt", "gte", "lt", "lte")
+# Operations on existing rows: written through under the exclusive lock, never journaled
+WRITE_THROUGH_OPS = ("update", "delete", "delete_where")
+# Workbook custom property holding {journal owner: last applied sequence number}
+APPLIED_PROPERTY = "chatbot_journal_applied"
+# Owners remembered in it; an entry is only needed until that owner's journal is cleared
+MAX_APPLIED_OWNERS = 64
+
+
+class TableError(Exception):
+    """A mutation was rejected (unknown sheet/column, row out of range, no match)."""
+
+
+class _Workbook:
+    def __init__(self, path: str):
+        self.path = path
+        self.journal_path = os.path.join(EXCEL_JOURNAL_DIR, f"{os.path.basename(path)}.{os.getpid()}.journal")
+        # Ids of ops journaled here; the suffix tells apart processes that reuse a pid
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.seq = 0
+        self.applied: Dict[str, int] = {}  # owner -> last sequence number the file holds
+        self.lock = threading.RLock()
+        self.sheets: Dict[str, pd.DataFrame] = {}
+        self.signature: Optional[Tuple[float, int]] = None  # (mtime, size) of the file we hold
+        self.pending: List[Dict[str, Any]] = []            # journaled ops not yet flushed
+        self.dirty_since: Optional[float] = None
+        # (sheet, column) -> lower-cased value -> row positions
+        self.indexes: Dict[Tuple[str, str], Dict[str, List[int]]] = {}
+
+    # ── file state ──
+    def _stat(self) -> Tuple[float, int]:
+        st = os.stat(self.path)
+        return st.st_mtime, st.st_size
+
+    def _load(self, locked: bool = False) -> None:
+        start = time.perf_counter()
+        if locked:
+            data = _read_bytes(self.path)
+        else:
+            with file_lock(self.path, exclusive=False):
+                data = _read_bytes(self.path)
+        sheets = pd.read_excel(io.BytesIO(data), sheet_name=None, dtype=str)
+        self.sheets = {name: df.fillna("").reset_index(drop=True) for name, df in sheets.items()}
+        self.applied = _applied_ids(data)
+        self.indexes = {}
+        self.signature = self._stat()
+        record_span("excel.load", time.perf_counter() - start)
+
+    def refresh(self, locked: bool = False) -> None:
+        """Load on first use; reload (and replay unflushed ops) after an outside edit.
+        `locked`: the caller already holds the exclusive file lock."""
+        if self.signature is None:
+            self._load(locked)
+            self.pending = self._adopt_journals(locked)
+            if self.pending:
+                logger.warning(f"Replaying {len(self.pending)} unflushed operation(s) on {self.path}")
+        elif self._stat() != self.signature:
+            logger.info(f"{self.path} changed on disk; reloading")
+            self._load(locked)
+        else:
+            return
+        kept = [op for op in self.pending if self._replay(op)]
+        if len(kept) != len(self.pending):
+            # Ops already in the file or rejected must not come back on a later replay
+            atomic_write(self.journal_path, "".join(json.dumps(op) + "\n" for op in kept))
+        self.pending = kept
+        if self.pending:
+            self.dirty_since = self.dirty_since or time.monotonic()
+
+    def _replay(self, op: Dict[str, Any]) -> bool:
+        """Re-apply a journaled op on a freshly loaded file; False if it no longer belongs in pending."""
+        if op["op"] in WRITE_THROUGH_OPS:
+            # Only journals written before these went write-through hold them; the
+            # rows they address may since have moved or been added by someone else
+            self._reject(op, "the rows it addressed may have changed since it was journaled")
+            return False
+        owner, seq = op.get("id") or (None, 0)
+        if owner is not None and self.applied.get(owner, 0) >= seq:
+            # Written to the workbook before a crash kept the journal from being cleared
+            return False
+        try:
+            self._apply(op)
+        except TableError as e:
+            self._reject(op, str(e))
+            return False
+        return True
+
+    def _reject(self, op: Dict[str, Any], reason: str) -> None:
+        """Keep an acknowledged op that cannot be applied for manual recovery instead of dropping it."""
+        os.makedirs(EXCEL_JOURNAL_DIR, exist_ok=True)
+        with open(self.journal_path + ".rejected", "a", encoding="utf-8") as f:
+            f.write(json.dumps({"op": op, "reason": reason}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        logger.error(f"Could not replay journaled {op['op']} on {self.path} ({reason}); "
+                     f"saved to {self.journal_path}.rejected")
+
+    # ── journal ──
+    @staticmethod
+    def _read_journal(journal_path: str) -> List[Dict[str, Any]]:
+        try:
+            with open(journal_path, "r", encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _adopt_journals(self, locked: bool) -> List[Dict[str, Any]]:
+        """Our own journal plus those of processes that died before flushing."""
+        pattern = os.path.join(EXCEL_JOURNAL_DIR, f"{glob.escape(os.path.basename(self.path))}.*.journal")
+        orphans = [p for p in glob.glob(pattern) if p != self.journal_path and not _pid_alive(p)]
+        ops = self._read_journal(self.journal_path)
+        if not orphans:
+            return ops
+        if not locked:
+            with file_lock(self.path, exclusive=True):
+                return self._adopt_journals(locked=True)
+        for orphan in orphans:
+            orphan_ops = self._read_journal(orphan)
+            # Move them into our journal first, so they stay durable and no one else adopts them
+            for op in orphan_ops:
+                self._journal(op)
+            os.unlink(orphan)
+            ops.extend(orphan_ops)
+        return ops
+
+    def _journal(self, op: Dict[str, Any]) -> None:
+        os.makedirs(EXCEL_JOURNAL_DIR, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(op) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    # ── operations ──
+    def sheet(self, sheet_name: Optional[str]) -> Tuple[str, pd.DataFrame]:
+        name = sheet_name or next(iter(self.sheets))
+        if name not in self.sheets:
+            raise TableError(f"Sheet '{name}' not found in '{os.path.basename(self.path)}'.")
+        return name, self.sheets[name]
+
+    def _check_columns(self, df: pd.DataFrame, columns) -> None:
+        for col in columns:
+            if col not in df.columns:
+                raise TableError(f"Column '{col}' not found in {os.path.basename(self.path)}.")
+
+    def _check_row(self, df: pd.DataFrame, row_index: int) -> None:
+        if row_index < 0 or row_index >= len(df):
+            raise TableError(f"Row index {row_index} is out of bounds.")
+
+    # ── indexes ──
+    def index(self, sheet: str, column: str) -> Optional[Dict[str, List[int]]]:
+        """Hash index of a key column (built on first use), or None if the column is not indexed."""
+        if column not in EXCEL_INDEXED_COLUMNS or column not in self.sheets[sheet].columns:
+            return None
+        idx = self.indexes.get((sheet, column))
+        if idx is None:
+            idx = {}
+            for pos, value in enumerate(self.sheets[sheet][column]):
+                idx.setdefault(str(value).lower(), []).append(pos)
+            self.indexes[(sheet, column)] = idx
+        return idx
+
+    def _index_set(self, sheet: str, pos: int, values: Dict[str, Any], old: Optional[Dict[str, Any]] = None) -> None:
+        for column, value in values.items():
+            idx = self.indexes.get((sheet, column))
+            if idx is None:
+                continue
+            if old is not None:
+                rows = idx.get(str(old[column]).lower(), [])
+                if pos in rows:
+                    rows.remove(pos)
+            idx.setdefault(str(value).lower(), []).append(pos)
+
+    def _drop_indexes(self, sheet: str) -> None:
+        for key in [k for k in self.indexes if k[0] == sheet]:
+            del self.indexes[key]
+
+    def find(self, sheet: str, criteria: Dict[str, Any]) -> List[int]:
+        """Row positions whose columns equal every criterion (case-insensitive)."""
+        df = self.sheets[sheet]
+        self._check_columns(df, criteria)
+        candidates: Optional[set] = None
+        scan = {}
+        for column, value in criteria.items():
+            idx = self.index(sheet, column)
+            if idx is None:
+                scan[column] = str(value).lower()
+                continue
+            rows = set(idx.get(str(value).lower(), ()))
+            candidates = rows if candidates is None else candidates & rows
+        if candidates is None:
+            return [int(p) for p in np.flatnonzero(match_mask(df, criteria).to_numpy())]
+        positions = sorted(candidates)
+        for column, value in scan.items():
+            col = df[column]
+            positions = [p for p in positions if str(col.iat[p]).lower() == value]
+        return positions
+
+    def query(self, sheet: str, filters: List[Dict[str, Any]], columns: Optional[List[str]],
+              limit: int, offset: int) -> Dict[str, Any]:
+        """Rows matching every filter ({"column", "op", "value"}), projected to `columns`."""
+        df = self.sheets[sheet]
+        for f in filters:
+            if f.get("op") not in FILTER_OPS:
+                raise TableError(f"Unknown filter operator '{f.get('op')}'. Use one of: {', '.join(FILTER_OPS)}.")
+        self._check_columns(df, [f["column"] for f in filters])
+        self._check_columns(df, columns or [])
+
+        # Equality filters go through the hash indexes; the rest only look at the survivors
+        equals = {f["column"]: f["value"] for f in filters if f["op"] == "eq"}
+        rows = np.array(self.find(sheet, equals) if equals else range(len(df)), dtype=int)
+        for f in filters:
+            if f["op"] == "eq" or not len(rows):
+                continue
+            values = df[f["column"]].to_numpy()[rows].astype(str)
+            if f["op"] == "prefix":
+                keep = np.char.startswith(np.char.lower(values), str(f["value"]).lower())
+            else:
+                keep = _compare(values, f["op"], f["value"])
+            rows = rows[keep]
+
+        projected = df.iloc[rows[offset:offset + limit]]
+        if columns:
+            projected = projected[columns]
+        records = [{"row_index": int(pos), **row} for pos, row in zip(projected.index, projected.to_dict("records"))]
+        return {"sheet": sheet, "total_matches": int(len(rows)), "returned": len(records), "records": records}
+
+    def _apply(self, op: Dict[str, Any]) -> Any:
+        """Apply one operation to the cached frames; raises TableError before changing anything."""
+        name, df = self.sheet(op.get("sheet"))
+        kind = op["op"]
+        if kind == "update":
+            self._check_row(df, op["row"])
+            self._check_columns(df, op["values"])
+            old = {col: df.at[op["row"], col] for col in op["values"]}
+            for col, value in op["values"].items():
+                df.at[op["row"], col] = value
+            self._index_set(name, op["row"], op["values"], old)
+            return None
+        if kind == "add":
+            row = {col: op["values"].get(col, "") for col in df.columns}
+            self.sheets[name] = pd.concat([df, pd.DataFrame([row], dtype=str)], ignore_index=True)
+            self._index_set(name, len(df), row)
+            return len(df)
+        if kind == "delete":
+            self._check_row(df, op["row"])
+            self.sheets[name] = df.drop(index=op["row"]).reset_index(drop=True)
+            self._drop_indexes(name)
+            return None
+        if kind == "delete_where":
+            positions = self.find(name, op["criteria"])
+            if not positions:
+                raise TableError(f"No records found matching the criteria: {op['criteria']}")
+            deleted = [{"row_index": p, "data": df.iloc[p].to_dict()} for p in positions]
+            self.sheets[name] = df.drop(index=df.index[positions]).reset_index(drop=True)
+            self._drop_indexes(name)
+            return deleted
+        raise ValueError(f"Unknown table operation: {kind}")
+
+    def mutate(self, op: Dict[str, Any], journal: bool = True) -> Any:
+        """Validate and apply one op; `journal=False` when the caller writes it through under the file lock."""
+        # Validate first so the journal only ever holds operations that apply cleanly
+        name, df = self.sheet(op.get("sheet"))
+        op["sheet"] = name
+        if op["op"] in ("update", "delete"):
+            self._check_row(df, op["row"])
+        if op["op"] == "update":
+            self._check_columns(df, op["values"])
+        if op["op"] == "delete_where" and not self.find(name, op["criteria"]):
+            raise TableError(f"No records found matching the criteria: {op['criteria']}")
+        if journal:
+            self.seq += 1
+            op["id"] = [self.owner, self.seq]
+            self._journal(op)
+        result = self._apply(op)
+        self.pending.append(op)
+        self.dirty_since = self.dirty_since or time.monotonic()
+        return result
+
+    def _write(self, f, applied: Dict[str, int]) -> None:
+        with pd.ExcelWriter(f, engine="openpyxl") as writer:
+            for s_name, s_df in self.sheets.items():
+                s_df.to_excel(writer, sheet_name=s_name, index=False)
+            writer.book.custom_doc_props.append(StringProperty(name=APPLIED_PROPERTY, value=json.dumps(applied)))
+
+    def _applied_after_flush(self) -> Dict[str, int]:
+        """self.applied plus the pending ops' ids, most recently written owners last, capped."""
+        applied = dict(self.applied)
+        for op in self.pending:
+            if op.get("id"):
+                owner, seq = op["id"]
+                applied.pop(owner, None)
+                applied[owner] = max(seq, self.applied.get(owner, 0))
+        return dict(list(applied.items())[-MAX_APPLIED_OWNERS:])
+
+    def flush(self, locked: bool = False) -> None:
+        """Write pending ops to the workbook. `locked`: the caller holds the exclusive file lock."""
+        if not self.pending:
+            return
+        if not locked:
+            with file_lock(self.path, exclusive=True):
+                return self.flush(locked=True)
+        start = time.perf_counter()
+        # Fold in edits made since the last access (another worker, or the
+        # workbook saved in Excel) instead of overwriting them
+        self.refresh(locked=True)
+        applied = self._applied_after_flush()
+        atomic_write(self.path, lambda f: self._write(f, applied))
+        self.signature = self._stat()
+        self.applied = applied
+        # The workbook now holds every pending op, so the journal can go
+        if os.path.exists(self.journal_path):
+            open(self.journal_path, "w").close()
+        flushed = len(self.pending)
+        self.pending = []
+        self.dirty_since = None
+        record_span("excel.flush", time.perf_counter() - start)
+        logger.info(f"Flushed {flushed} operation(s) to {self.path}")
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _applied_ids(data: bytes) -> Dict[str, int]:
+    """The APPLIED_PROPERTY map stored in an .xlsx file ({} if absent, e.g. a file we never wrote)."""
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            root = ElementTree.fromstring(z.read("docProps/custom.xml"))
+    except (KeyError, zipfile.BadZipFile, ElementTree.ParseError):
+        return {}
+    for prop in root:
+        if prop.get("name") == APPLIED_PROPERTY and len(prop):
+            try:
+                return {owner: int(seq) for owner, seq in json.loads(prop[0].text or "{}").items()}
+            except (ValueError, AttributeError):
+                return {}
+    return {}
+
+
+def _pid_alive(journal_path: str) -> bool:
+    """Whether the process that owns a <workbook>.<pid>.journal file is still running."""
+    try:
+        pid = int(journal_path.rsplit(".", 2)[-2])
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass  # exists, owned by someone else
+    return True
+
+
+def _compare(values: np.ndarray, op: str, bound: Any) -> np.ndarray:
+    """Range comparison: numeric when the bound is a number (cells like "25,000" included),
+    otherwise case-insensitive string order."""
+    try:
+        number = float(str(bound).replace(",", ""))
+    except ValueError:
+        left, right = np.char.lower(values), str(bound).lower()
+    else:
+        left = pd.to_numeric(pd.Series(values).str.replace(",", ""), errors="coerce").to_numpy()
+        right = number
+    with np.errstate(invalid="ignore"):
+        return {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}[op]
+
+
+def match_mask(df: pd.DataFrame, criteria: Dict[str, Any]) -> pd.Series:
+    """Rows whose columns equal every criterion (case-insensitive string compare)."""
+    mask = pd.Series(True, index=df.index)
+    for column, value in criteria.items():
+        if column not in df.columns:
+            raise TableError(f"Column '{column}' not found.")
+        mask &= df[column].astype(str).str.lower() == str(value).lower()
+    return mask
+
+
+class ExcelEngine:
+    def __init__(self, flush_delay: float = EXCEL_FLUSH_DELAY):
+        self.flush_delay = flush_delay
+        self._workbooks: Dict[str, _Workbook] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def _workbook(self, path: str) -> _Workbook:
+        with self._lock:
+            wb = self._workbooks.get(path)
+            if wb is None:
+                wb = self._workbooks[path] = _Workbook(path)
+            return wb
+
+    # ── reads ──
+    def snapshot(self, path: str, sheet_name: Optional[str] = None) -> Tuple[List[str], str, pd.DataFrame]:
+        """(sheet names, selected sheet, copy of its DataFrame), current with the file on disk."""
+        wb = self._refreshed(path)
+        with wb.lock:
+            name, df = wb.sheet(sheet_name)
+            return list(wb.sheets), name, df.copy()
+
+    def sheets(self, path: str) -> Dict[str, pd.DataFrame]:
+        wb = self._refreshed(path)
+        with wb.lock:
+            return {name: df.copy() for name, df in wb.sheets.items()}
+
+    def columns(self, path: str, sheet_name: Optional[str] = None) -> List[str]:
+        wb = self._refreshed(path)
+        with wb.lock:
+            return wb.sheet(sheet_name)[1].columns.tolist()
+
+    def _refreshed(self, path: str) -> _Workbook:
+        wb = self._workbook(path)
+        with wb.lock:
+            wb.refresh()
+            replayed = wb.dirty_since is not None
+        if replayed:
+            # Journaled ops were replayed on load; persist them without waiting for a write
+            self._schedule()
+        return wb
+
+    def query(self, path: str, filters: List[Dict[str, Any]], columns: Optional[List[str]] = None,
+              sheet_name: Optional[str] = None, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        wb = self._refreshed(path)
+        with wb.lock:
+            name, _ = wb.sheet(sheet_name)
+            return wb.query(name, filters, columns, limit, offset)
+
+    # ── writes ──
+    def mutate(self, path: str, op: Dict[str, Any]) -> Any:
+        wb = self._workbook(path)
+        if op["op"] in WRITE_THROUGH_OPS or self.flush_delay <= 0:
+            # Write-through: no other process can change the file between the
+            # refresh this op is validated against and the write that persists it
+            with wb.lock, file_lock(wb.path, exclusive=True):
+                wb.refresh(locked=True)
+                result = wb.mutate(op, journal=False)
+                try:
+                    wb.flush(locked=True)
+                except Exception:
+                    # Not persisted: forget the in-memory change, reload (and our journal) on next use
+                    wb.signature = None
+                    wb.pending = []
+                    raise
+            return result
+        with wb.lock:
+            wb.refresh()
+            result = wb.mutate(op)
+        self._schedule()
+        return result
+
+    def flush(self, path: Optional[str] = None) -> None:
+        """Write pending changes now (all workbooks, or just `path`)."""
+        with self._lock:
+            if path is None:
+                workbooks = list(self._workbooks.values())
+            else:
+                workbooks = [self._workbooks[path]] if path in self._workbooks else []
+        for wb in workbooks:
+            with wb.lock:
+                try:
+                    wb.flush()
+                except Exception as e:
+                    # The journal still holds the changes; retried on the next pass
+                    logger.error(f"Flushing {wb.path} failed: {e}")
+
+    # ── write-behind ──
+    def _schedule(self) -> None:
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="excel-flusher", daemon=True)
+                self._flusher.start()
+        self._wakeup.set()
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                with self._lock:
+                    due = [wb.dirty_since for wb in self._workbooks.values() if wb.dirty_since is not None]
+                if not due:
+                    break
+                wait = min(due) + self.flush_delay - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                    continue
+                now = time.monotonic()
+                with self._lock:
+                    ready = [wb for wb in self._workbooks.values()
+                             if wb.dirty_since is not None and now - wb.dirty_since >= self.flush_delay]
+                for wb in ready:
+                    with wb.lock:
+                        try:
+                            wb.flush()
+                        except Exception as e:
+                            logger.error(f"Flushing {wb.path} failed, retrying: {e}")
+                            wb.dirty_since = time.monotonic()
+
+
+excel_engine = ExcelEngine()
+atexit.register(excel_engine.flush)
@@ -1,10 +1,10 @@
-import pandas as pd
 import openpyxl
 import os
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 import logging
 import re
+from chatbot_server.excel_engine import excel_engine, TableError
 
 # Set up logging for Excel operations
 logging.basicConfig(level=logging.INFO)
@@ -42,13 +42,15 @@ def _log_operation(operation: str, filename: str, details: str):
     except Exception as e:
         logger.error(f"Failed to write to log file: {e}")
 
-def read_excel_file(filename: str, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+def read_excel_file(filename: str, sheet_name: Optional[str] = None, offset: int = 0,
+                    limit: Optional[int] = None) -> Dict[str, Any]:
     """
     Read Excel file and return its contents as a dictionary.
     
     Args:
         filename: Name of the Excel file
         sheet_name: Specific sheet to read (optional)
+        offset / limit: Page of rows to return in "data" (all rows if limit is omitted)
     
     Returns:
         Dict containing file info and data
@@ -56,24 +58,22 @@ def read_excel_file(filename: str, sheet_name: Optional[str] = None) -> Dict[str
     filepath = _get_excel_path(filename)
     
     try:
+        # Served from the engine's cached copy (reloaded only if the file changed)
+        sheets, current_sheet, df = excel_engine.snapshot(filepath, sheet_name)
         if sheet_name:
-            df = pd.read_excel(filepath, sheet_name=sheet_name)
             sheets = [sheet_name]
-        else:
-            # Read all sheets
-            excel_file = pd.ExcelFile(filepath)
-            sheets = excel_file.sheet_names
-            df = pd.read_excel(filepath, sheet_name=sheets[0])  # Default to first sheet
         
-        _log_operation("READ", filename, f"Read {len(df)} rows from sheet(s): {sheets}")
+        page = df.iloc[offset:] if limit is None else df.iloc[offset:offset + limit]
+        _log_operation("READ", filename, f"Read {len(page)} of {len(df)} rows from sheet(s): {sheets}")
         
         return {
             "filename": filename,
             "sheets": sheets,
-            "current_sheet": sheet_name or sheets[0],
+            "current_sheet": current_sheet,
             "rows": len(df),
             "columns": df.columns.tolist(),
-            "data": df.to_dict('records')
+            "offset": offset,
+            "data": [{"row_index": int(i), **row} for i, row in zip(page.index, page.to_dict('records'))]
         }
     
     except Exception as e:
@@ -125,32 +125,14 @@ def update_excel_row(filename: str, row_index: int, updates: Dict[str, Any], she
         return {"error": f"File not found in the 'pdfs' directory: {filename}"}
 
     try:
-        xls = pd.read_excel(filepath, sheet_name=None, dtype=str)
-        target_sheet = sheet_name or list(xls.keys())[0]
-        if target_sheet not in xls:
-            return {"error": f"Sheet '{target_sheet}' not found in '{filename}'."}
-
-        df = xls[target_sheet]
-        df.fillna("", inplace=True)
-
-        if row_index < 0 or row_index >= len(df):
-            return {"error": f"Row index {row_index} is out of bounds."}
-
-        for col, value in updates.items():
-            if col in df.columns:
-                # Apply intelligent data cleaning
-                df.loc[row_index, col] = _clean_data_for_excel(col, value)
-            else:
-                return {"error": f"Column '{col}' not found in {filename}."}
-        
-        xls[target_sheet] = df
-
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            for s_name, s_df in xls.items():
-                s_df.to_excel(writer, sheet_name=s_name, index=False)
-
+        # Apply intelligent data cleaning
+        values = {col: _clean_data_for_excel(col, value) for col, value in updates.items()}
+        excel_engine.mutate(filepath, {"op": "update", "sheet": sheet_name, "row": row_index, "values": values})
+        _log_operation("UPDATE", filename, f"Row {row_index}: {values}")
         return {"message": f"Row {row_index} updated successfully."}
 
+    except TableError as e:
+        return {"error": str(e)}
     except PermissionError:
         return {"error": f"Could not modify '{filename}' due to a permission error. Please ensure the file is not open in another program."}
     except Exception as e:
@@ -164,30 +146,15 @@ def add_excel_row(filename: str, new_data: Dict[str, Any], sheet_name: Optional[
         return {"error": f"File not found in the 'pdfs' directory: {filename}"}
 
     try:
-        xls = pd.read_excel(filepath, sheet_name=None, dtype=str)
-        target_sheet = sheet_name or list(xls.keys())[0]
-        if target_sheet not in xls:
-            return {"error": f"Sheet '{target_sheet}' not found in '{filename}'."}
-            
-        df = xls[target_sheet]
-        df.fillna("", inplace=True)
-
-        new_row_data = {col: "" for col in df.columns}
-        for key, value in new_data.items():
-            if key in new_row_data:
-                # Apply intelligent data cleaning
-                new_row_data[key] = _clean_data_for_excel(key, value)
-        
-        new_row_df = pd.DataFrame([new_row_data])
-        df = pd.concat([df, new_row_df], ignore_index=True)
-        xls[target_sheet] = df
-
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            for s_name, s_df in xls.items():
-                s_df.to_excel(writer, sheet_name=s_name, index=False)
-
+        columns = excel_engine.columns(filepath, sheet_name)
+        # Unknown columns are ignored; apply intelligent data cleaning to the rest
+        values = {key: _clean_data_for_excel(key, value) for key, value in new_data.items() if key in columns}
+        excel_engine.mutate(filepath, {"op": "add", "sheet": sheet_name, "values": values})
+        _log_operation("ADD", filename, f"{values}")
         return {"message": "Row added successfully."}
 
+    except TableError as e:
+        return {"error": str(e)}
     except PermissionError:
         return {"error": f"Could not modify '{filename}' due to a permission error. Please ensure the file is not open in another program."}
     except Exception as e:
@@ -201,26 +168,12 @@ def delete_excel_row(filename: str, row_index: int, sheet_name: Optional[str] =
         return {"error": f"File not found in the 'pdfs' directory: {filename}"}
 
     try:
-        xls = pd.read_excel(filepath, sheet_name=None, dtype=str)
-        target_sheet = sheet_name or list(xls.keys())[0]
-        if target_sheet not in xls:
-            return {"error": f"Sheet '{target_sheet}' not found in '{filename}'."}
-
-        df = xls[target_sheet]
-        df.fillna("", inplace=True)
-
-        if row_index < 0 or row_index >= len(df):
-            return {"error": f"Row index {row_index} is out of bounds."}
-
-        df = df.drop(index=row_index).reset_index(drop=True)
-        xls[target_sheet] = df
-
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            for s_name, s_df in xls.items():
-                s_df.to_excel(writer, sheet_name=s_name, index=False)
-
+        excel_engine.mutate(filepath, {"op": "delete", "sheet": sheet_name, "row": row_index})
+        _log_operation("DELETE", filename, f"Row {row_index}")
         return {"message": f"Row {row_index} deleted successfully."}
 
+    except TableError as e:
+        return {"error": str(e)}
     except PermissionError:
         return {"error": f"Could not modify '{filename}' due to a permission error. Please ensure the file is not open in another program."}
     except Exception as e:
@@ -234,56 +187,44 @@ def delete_excel_record_by_criteria(filename: str, criteria: Dict[str, Any], she
         return {"error": f"File not found in the 'pdfs' directory: {filename}"}
 
     try:
-        xls = pd.read_excel(filepath, sheet_name=None, dtype=str)
-        target_sheet = sheet_name or list(xls.keys())[0]
-        if target_sheet not in xls:
-            return {"error": f"Sheet '{target_sheet}' not found in '{filename}'."}
-
-        df = xls[target_sheet]
-        df.fillna("", inplace=True)
-
-        # Find matching rows based on criteria
-        mask = pd.Series([True] * len(df))
-        matched_info = []
-        
-        for column, value in criteria.items():
-            if column in df.columns:
-                # Convert both to strings for comparison and handle case-insensitive matching
-                column_mask = df[column].astype(str).str.lower() == str(value).lower()
-                mask = mask & column_mask
-            else:
-                return {"error": f"Column '{column}' not found in {filename}."}
-        
-        matching_rows = df[mask]
-        
-        if len(matching_rows) == 0:
-            return {"error": f"No records found matching the criteria: {criteria}"}
-        
-        # Store info about what we're deleting
-        for idx, row in matching_rows.iterrows():
-            matched_info.append({
-                "row_index": idx,
-                "data": row.to_dict()
-            })
-        
-        # Delete the matching rows
-        df = df[~mask].reset_index(drop=True)
-        xls[target_sheet] = df
-
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            for s_name, s_df in xls.items():
-                s_df.to_excel(writer, sheet_name=s_name, index=False)
-
+        matched_info = excel_engine.mutate(filepath, {"op": "delete_where", "sheet": sheet_name, "criteria": criteria})
+        _log_operation("DELETE", filename, f"{len(matched_info)} record(s) matching {criteria}")
         return {
-            "message": f"Successfully deleted {len(matching_rows)} record(s) matching criteria: {criteria}",
+            "message": f"Successfully deleted {len(matched_info)} record(s) matching criteria: {criteria}",
             "deleted_records": matched_info
         }
 
+    except TableError as e:
+        return {"error": str(e)}
     except PermissionError:
         return {"error": f"Could not modify '{filename}' due to a permission error. Please ensure the file is not open in another program."}
     except Exception as e:
         return {"error": f"An unexpected error occurred while deleting records: {str(e)}"}
 
+def query_excel_rows(filename: str, filters: List[Dict[str, Any]], columns: Optional[List[str]] = None,
+                     limit: int = 20, offset: int = 0, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Find rows matching structured filters.
+
+    Args:
+        filename: Name of the Excel file
+        filters: [{"column": ..., "op": "eq" | "prefix" | "gt" | "gte" | "lt" | "lte", "value": ...}]
+        columns: Columns to return (all if omitted); every record also carries its row_index
+        limit / offset: Page of matches to return
+
+    Returns:
+        Dict with total_matches and the matching records, or {"error": ...}
+    """
+    filepath = _get_excel_path(filename)
+    try:
+        result = excel_engine.query(filepath, filters, columns, sheet_name, limit, offset)
+        _log_operation("QUERY", filename, f"{filters} -> {result['total_matches']} match(es)")
+        return result
+    except TableError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"An unexpected error occurred while querying records: {str(e)}"}
+
 def get_excel_info(filename: str) -> Dict[str, Any]:
     """
     Get information about an Excel file structure.
@@ -297,15 +238,14 @@ def get_excel_info(filename: str) -> Dict[str, Any]:
     filepath = _get_excel_path(filename)
     
     try:
-        excel_file = pd.ExcelFile(filepath)
+        sheets = excel_engine.sheets(filepath)
         info = {
             "filename": filename,
-            "sheets": excel_file.sheet_names,
+            "sheets": list(sheets),
             "sheet_info": {}
         }
         
-        for sheet in excel_file.sheet_names:
-            df = pd.read_excel(filepath, sheet_name=sheet)
+        for sheet, df in sheets.items():
             info["sheet_info"][sheet] = {
                 "rows": len(df),
                 "columns": df.columns.tolist(),
@@ -0,0 +1,131 @@
+# chatbot-server/file_locks.py
+
+"""
+Per-file reader/writer locking and atomic writes for the file tools.
+
+file_lock(path, exclusive) takes two locks:
+  • an in-process reader/writer lock, so threads of one worker queue up
+    without opening lock files
+  • an fcntl.flock on a sidecar lock file in FILE_LOCK_DIR, so other uvicorn
+    workers and the ingest processes are excluded as well
+
+atomic_write() writes to a temp file in the target's directory, fsyncs it and
+renames it over the target, so readers and crashes only ever see the old or the
+new file, never a truncated one.
+"""
+
+import os
+import fcntl
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, IO, Iterator, Union
+
+FILE_LOCK_DIR = os.getenv("FILE_LOCK_DIR", "/app/.locks")
+
+
+class RWLock:
+    """Writer-preferring reader/writer lock (not reentrant)."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self) -> None:
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+_locks: Dict[str, RWLock] = {}
+_locks_guard = threading.Lock()
+
+
+def _rwlock(path: str) -> RWLock:
+    with _locks_guard:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = RWLock()
+        return lock
+
+
+def _lock_file(path: str) -> str:
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(FILE_LOCK_DIR, f"{os.path.basename(path)}.{digest}.lock")
+
+
+@contextmanager
+def file_lock(path: str, exclusive: bool = True) -> Iterator[None]:
+    """Hold a shared (readers) or exclusive (writer) lock on `path` across threads and processes."""
+    path = os.path.abspath(path)
+    rw = _rwlock(path)
+    rw.acquire_write() if exclusive else rw.acquire_read()
+    try:
+        os.makedirs(FILE_LOCK_DIR, exist_ok=True)
+        with open(_lock_file(path), "a") as lock_fd:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+    finally:
+        rw.release_write() if exclusive else rw.release_read()
+
+
+def atomic_write(path: str, data: Union[str, bytes, Callable[[IO[bytes]], None]], encoding: str = "utf-8") -> None:
+    """
+    Replace `path` with new content in one rename.
+
+    `data` is the full content, or a callable that writes it to the binary file
+    object it is given. Callers should hold file_lock(path) so concurrent
+    writers do not both rename over each other's read-modify-write.
+    """
+    directory, base = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{base}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if callable(data):
+                data(f)
+            else:
+                f.write(data.encode(encoding) if isinstance(data, str) else data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            # Keep the original permissions rather than mkstemp's 0600
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    # Persist the rename itself
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
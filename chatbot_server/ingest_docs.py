@@ -14,11 +14,23 @@ Supported extensions in this version
 
 Add more by updating EXTENSION_MAP.
 
+Files are parsed in a process pool, their chunks are embedded in batches of
+--batch-size with at most --concurrency requests in flight, and each file's
+vectors replace its previous ones with multi-row INSERTs in one transaction.
+Progress is reported as files/s and chunks/s.
+
 Run inside the container:
-    docker compose exec chatbot-server python ingest_docs.py
+    docker compose exec chatbot-server python ingest_docs.py [--workers N] [--batch-size N] [--concurrency N]
 """
 
+import os
+import time
+import argparse
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait,
+)
 from pathlib import Path
+from sqlalchemy import text
 from langchain.document_loaders import (
     UnstructuredPDFLoader,            # OCR-capable for scanned PDFs
     UnstructuredWordDocumentLoader,   # .doc / .docx
@@ -26,7 +38,9 @@ from langchain.document_loaders import (
     UnstructuredFileLoader,           # .html / .eml / .txt
 )
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from chatbot_server.vectorstore import get_vectorstore
+from chatbot_server.vectorstore import get_engine, get_vectorstore, insert_chunks, chunk_fingerprint
+from chatbot_server.answer_cache import answer_cache
+from chatbot_server.catalog import file_hash, upsert_document
 
 # --------------------------------------------------------------------
 PDF_DIR       = Path("/app/pdfs")     # folder mounted in docker-compose.yml
@@ -46,7 +60,7 @@ EXTENSION_MAP = {
 
 
 def load_and_split(file_path: Path):
-    """Load one file, split into chunks, tag each chunk with its source path and category."""
+    """Load one file, split into chunks, tag each chunk with its source path, category and fingerprint."""
     loader_cls = EXTENSION_MAP.get(file_path.suffix.lower())
     if not loader_cls:
         print(f"⚠️  Skipping unsupported type: {file_path.name}")
@@ -71,11 +85,44 @@ def load_and_split(file_path: Path):
             topic = file_path.name.replace("bedford_", "").replace(".txt", "").replace(".pdf", "")
             doc.metadata["topic"] = topic
 
+        # Fingerprint lets re-indexing keep chunks whose text did not change
+        doc.metadata["chunk_hash"] = chunk_fingerprint(doc)
+
     return chunks
 
 
+class _FileJob:
+    """One parsed file whose chunks are being embedded, possibly across several batches."""
+
+    def __init__(self, path: Path, chunks):
+        self.path = path
+        self.chunks = chunks
+        self.vectors = [None] * len(chunks)
+        self.remaining = len(chunks)
+
+
+def _write_file(engine, job: _FileJob) -> None:
+    """Replace all vectors of one file in a single transaction."""
+    with engine.begin() as conn:
+        conn.execute(
+            text("DELETE FROM langchain_pg_embedding WHERE cmetadata->>'source' = :p"),
+            {"p": str(job.path)},
+        )
+        insert_chunks(conn, job.chunks, job.vectors)
+        upsert_document(conn, job.path, job.chunks, file_hash(job.path), job.path.stat().st_mtime)
+    answer_cache.invalidate_source(str(job.path))
+
+
 def main() -> None:
-    vs = get_vectorstore()
+    parser = argparse.ArgumentParser(description="Bulk-ingest all supported documents in " + str(PDF_DIR))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_PARSE_WORKERS", os.cpu_count() or 1)),
+                        help="processes used to load/OCR/split files")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("INGEST_EMBED_BATCH_SIZE", "256")),
+                        help="chunks per embedding request")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("INGEST_EMBED_CONCURRENCY", "4")),
+                        help="embedding requests in flight at once")
+    args = parser.parse_args()
+
     files = sorted(
         f for f in PDF_DIR.iterdir()
         if f.suffix.lower() in EXTENSION_MAP
@@ -85,14 +132,75 @@ def main() -> None:
         print(f"❌  No supported files found in {PDF_DIR.resolve()}")
         return
 
-    for f in files:
-        chunks = load_and_split(f)
-        if not chunks:
-            continue
-        vs.add_documents(chunks)
-        print(f"✅  Indexed {f.name:<50s} ({len(chunks)} chunks)")
-
-    print("🎉  Bulk ingest complete.")
+    print(f"📚  Ingesting {len(files)} files "
+          f"(workers={args.workers}, batch={args.batch_size}, concurrency={args.concurrency})")
+    started = time.perf_counter()
+    files_done = chunks_done = 0
+
+    def progress() -> str:
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        return (f"[{files_done}/{len(files)} files, "
+                f"{files_done / elapsed:.2f} files/s, {chunks_done / elapsed:.1f} chunks/s]")
+
+    # Parsing (and OCR) is CPU-bound, so it runs in worker processes. They are
+    # started before any database connection exists in this process.
+    with ProcessPoolExecutor(max_workers=args.workers) as parse_pool, \
+         ThreadPoolExecutor(max_workers=args.concurrency) as embed_pool:
+        parse_futures = {parse_pool.submit(load_and_split, f): f for f in files}
+
+        vs = get_vectorstore()
+        engine = get_engine()
+        buffer = []          # (job, chunk index) waiting for a full batch
+        in_flight = {}       # embedding future → [(job, chunk index), ...]
+
+        def submit_batch():
+            items = buffer[:args.batch_size]
+            del buffer[:args.batch_size]
+            texts = [job.chunks[i].page_content for job, i in items]
+            in_flight[embed_pool.submit(vs.embeddings.embed_documents, texts)] = items
+
+        def collect(block: bool):
+            nonlocal files_done, chunks_done
+            if not in_flight:
+                return
+            done, _ = wait(list(in_flight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for fut in done:
+                items = in_flight.pop(fut)
+                for (job, i), vector in zip(items, fut.result()):
+                    job.vectors[i] = vector
+                    job.remaining -= 1
+                    if job.remaining == 0:
+                        _write_file(engine, job)
+                        files_done += 1
+                        chunks_done += len(job.chunks)
+                        print(f"✅  Indexed {job.path.name:<50s} ({len(job.chunks)} chunks) {progress()}")
+
+        for fut in as_completed(parse_futures):
+            f = parse_futures[fut]
+            try:
+                chunks = fut.result()
+            except Exception as e:
+                print(f"❌  Failed to parse {f.name}: {e}")
+                continue
+            if not chunks:
+                continue
+            job = _FileJob(f, chunks)
+            buffer.extend((job, i) for i in range(len(chunks)))
+            while len(buffer) >= args.batch_size:
+                # Bounded concurrency: wait for a request to finish before queuing more
+                while len(in_flight) >= args.concurrency:
+                    collect(block=True)
+                submit_batch()
+            collect(block=False)
+
+        while buffer:
+            while len(in_flight) >= args.concurrency:
+                collect(block=True)
+            submit_batch()
+        while in_flight:
+            collect(block=True)
+
+    print(f"🎉  Bulk ingest complete. {progress()}")
 
 
 if __name__ == "__main__":
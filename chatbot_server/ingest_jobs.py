@@ -0,0 +1,155 @@
+# chatbot-server/ingest_jobs.py
+
+"""
+Ingest job queue shared by the API and the watcher.
+
+/upload writes the file into the documents folder and inserts a 'queued' job
+(at most one open job per file and content: concurrent identical uploads share it);
+the watcher claims queued jobs (FOR UPDATE SKIP LOCKED), feeds them straight
+into its ingest queue and records the outcome, so clients can poll
+GET /ingest/{job_id} to learn when an upload is searchable.
+
+Job statuses: queued → running → done | failed
+"""
+
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from chatbot_server.catalog import CATALOG_TABLE, ensure_catalog, file_hash
+from chatbot_server.vectorstore import get_engine
+
+JOBS_TABLE = "ingest_jobs"
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_lock = threading.Lock()
+_ready = False
+
+_COLUMNS = "id, source, filename, content_hash, status, error, chunk_count, created_at, started_at, finished_at"
+
+
+def ensure_jobs_table() -> None:
+    global _ready
+    if _ready:
+        return
+    with _lock:
+        if _ready:
+            return
+        with get_engine().begin() as conn:
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {JOBS_TABLE} (
+                    id           bigserial PRIMARY KEY,
+                    source       text NOT NULL,
+                    filename     text NOT NULL,
+                    content_hash text NOT NULL,
+                    status       text NOT NULL DEFAULT '{QUEUED}',
+                    error        text,
+                    chunk_count  integer,
+                    created_at   timestamptz NOT NULL DEFAULT now(),
+                    started_at   timestamptz,
+                    finished_at  timestamptz
+                )
+            """))
+            # Only the handful of open jobs are ever scanned by status
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {JOBS_TABLE}_open_idx ON {JOBS_TABLE} (id) "
+                f"WHERE status IN ('{QUEUED}', '{RUNNING}')"
+            ))
+            # Backs the ON CONFLICT in create_job
+            conn.execute(text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {JOBS_TABLE}_open_source_idx ON {JOBS_TABLE} (source, content_hash) "
+                f"WHERE status IN ('{QUEUED}', '{RUNNING}')"
+            ))
+        _ready = True
+
+
+def find_duplicate(source: str, content_hash: str) -> Optional[Dict]:
+    """
+    The catalogued document at `source`, if it is already indexed with this
+    content and the file on disk still holds it.
+
+    The same content under another filename is not a duplicate: it is a new
+    document and gets indexed and catalogued on its own. Nor is a file that was
+    deleted or changed on disk but not reconciled yet: the upload restores it.
+    """
+    ensure_catalog()
+    with get_engine().connect() as conn:
+        row = conn.execute(text(f"""
+            SELECT filename FROM {CATALOG_TABLE} WHERE source = :s AND content_hash = :h
+        """), {"s": source, "h": content_hash}).mappings().first()
+    if row is None or not os.path.isfile(source) or file_hash(source) != content_hash:
+        return None
+    return dict(row)
+
+
+def create_job(source: str, filename: str, content_hash: str) -> Tuple[int, bool]:
+    """
+    Queue an ingest of `source`. Returns (job_id, created): created is False when
+    an open job for the same source and content already existed and was reused.
+    """
+    ensure_jobs_table()
+    params = {"s": source, "f": filename, "h": content_hash}
+    while True:
+        with get_engine().begin() as conn:
+            # One statement, so concurrent identical uploads cannot both insert
+            job_id = conn.execute(text(f"""
+                INSERT INTO {JOBS_TABLE} (source, filename, content_hash) VALUES (:s, :f, :h)
+                ON CONFLICT (source, content_hash) WHERE status IN ('{QUEUED}', '{RUNNING}') DO NOTHING
+                RETURNING id
+            """), params).scalar_one_or_none()
+            if job_id is not None:
+                return job_id, True
+            job_id = conn.execute(text(f"""
+                SELECT id FROM {JOBS_TABLE}
+                WHERE source = :s AND content_hash = :h AND status IN ('{QUEUED}', '{RUNNING}')
+            """), params).scalar_one_or_none()
+        if job_id is not None:
+            return job_id, False
+        # The open job finished in between: try the insert again
+
+
+def get_job(job_id: int) -> Optional[Dict]:
+    ensure_jobs_table()
+    with get_engine().connect() as conn:
+        row = conn.execute(text(f"SELECT {_COLUMNS} FROM {JOBS_TABLE} WHERE id = :id"),
+                           {"id": job_id}).mappings().first()
+    return dict(row) if row else None
+
+
+def claim_jobs(limit: int = 20) -> List[Dict]:
+    """Mark up to `limit` queued jobs as running and return them (oldest first)."""
+    ensure_jobs_table()
+    with get_engine().begin() as conn:
+        rows = conn.execute(text(f"""
+            UPDATE {JOBS_TABLE} SET status = '{RUNNING}', started_at = now()
+            WHERE id IN (
+                SELECT id FROM {JOBS_TABLE} WHERE status = '{QUEUED}'
+                ORDER BY id LIMIT :limit FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, source
+        """), {"limit": limit}).mappings().all()
+    return sorted((dict(r) for r in rows), key=lambda r: r["id"])
+
+
+def requeue_running() -> int:
+    """Put jobs a stopped watcher left running back in the queue (called on watcher start)."""
+    ensure_jobs_table()
+    with get_engine().begin() as conn:
+        return conn.execute(text(
+            f"UPDATE {JOBS_TABLE} SET status = '{QUEUED}', started_at = NULL WHERE status = '{RUNNING}'"
+        )).rowcount
+
+
+def finish_jobs(job_ids: Iterable[int], status: str, error: Optional[str] = None,
+                chunk_count: Optional[int] = None) -> None:
+    job_ids = list(job_ids)
+    if not job_ids:
+        return
+    with get_engine().begin() as conn:
+        conn.execute(text(f"""
+            UPDATE {JOBS_TABLE}
+            SET status = :status, error = :error, chunk_count = :chunks, finished_at = now()
+            WHERE id = ANY(:ids)
+        """), {"status": status, "error": error, "chunks": chunk_count, "ids": job_ids})
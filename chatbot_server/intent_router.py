@@ -0,0 +1,268 @@
+# chatbot-server/intent_router.py
+
+"""
+Deterministic pre-routing of chat requests.
+
+Every agent turn costs one LLM call to pick a tool and another to phrase its
+result. Most requests are plain information questions whose only possible
+tool call is the document search, so they are classified up front and routed:
+
+  • info        → document search/answer directly (no agent)
+  • capability  → document catalog overview directly (no agent)
+  • excel/text  → the agent, except a bare request to read a named file
+                  ("show me order_inventory.xlsx": no filters, conditions or
+                  questions), which is served by the read tool directly
+  • anything ambiguous, or a reply inside an ongoing conversation (the agent
+    asked a question, or the message refers back to earlier turns) → the agent
+
+Classification is keyword rules first. If INTENT_ROUTER_EMBEDDINGS=1, messages
+the rules leave open are matched against per-intent centroids of example
+utterances (nearest centroid by cosine similarity, with a minimum similarity and
+a margin over the runner-up); the question's embedding is returned so the
+document search can reuse it.
+"""
+
+import os
+import re
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, BaseMessage
+
+logger = logging.getLogger(__name__)
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1") == "1"
+INTENT_ROUTER_EMBEDDINGS = os.getenv("INTENT_ROUTER_EMBEDDINGS", "0") == "1"
+INTENT_ROUTER_MIN_SIMILARITY = float(os.getenv("INTENT_ROUTER_MIN_SIMILARITY", "0.80"))
+INTENT_ROUTER_MARGIN = float(os.getenv("INTENT_ROUTER_MARGIN", "0.03"))
+
+INFO, CAPABILITY, EXCEL, TEXT = "info", "capability", "excel", "text"
+
+# Routes (also the chatbot_chat_routes_total label values)
+ROUTE_AGENT = "agent"
+ROUTE_DOCUMENTS = "documents"
+ROUTE_CAPABILITY = "capability"
+ROUTE_EXCEL_READ = "excel_read"
+ROUTE_TEXT_READ = "text_read"
+
+
+@dataclass
+class Route:
+    route: str                      # one of the ROUTE_* values
+    intent: Optional[str] = None    # classified intent, None if ambiguous
+    reason: str = ""                # which rule or model decided (for logs)
+    filename: Optional[str] = None  # file named in the request, for the read routes
+    embedding: Optional[List[float]] = None  # question embedding, when the centroid model ran
+
+
+# === Keyword rules ===
+
+_FILENAME = re.compile(r"\b[\w\-]+\.(xlsx|xls|csv|txt|md)\b", re.IGNORECASE)
+
+_EXCEL = re.compile(
+    r"\b(excel|spreadsheet|xlsx|workbook|sheet|row|rows|column|columns|record|records|"
+    r"order number|part number|inventory|account info|seller|buyer)\b"
+    r"|\bsold\b.*\bto\b",
+    re.IGNORECASE,
+)
+_TEXT = re.compile(r"\b(text file|txt|recipe|note|notes|line|lines|paragraph)\b", re.IGNORECASE)
+# Words that may be about the spreadsheets' data as much as about the documents
+_DATA = re.compile(r"\b(price|prices|cost|order|orders|account|accounts|balance|sold|bought|purchased?|"
+                   r"pay|pays|paid|paying|spend|spends|spent|spending)\b",
+                   re.IGNORECASE)
+
+# Verbs that change a file; any of them makes a file request a job for the agent
+_WRITE = re.compile(
+    r"\b(add|create|insert|update|change|modify|edit|rename|delete|remove|drop|"
+    r"write|append|replace|overwrite)\b",
+    re.IGNORECASE,
+)
+# The whole message is "<read verb> <file>"; any other words (a filter, a condition, a
+# question about the data) need the agent or the query tool
+_BARE_READ = re.compile(
+    r"^\s*(please\s+)?(can you\s+|could you\s+)?(read|show|display|open|view|print|what'?s in)"
+    r"(\s+me)?(\s+(the|file|contents?|of))*\s+[\w\-]+\.(xlsx|xls|csv|txt|md)"
+    r"(\s+(file|please))*\s*[.!?]?\s*$",
+    re.IGNORECASE,
+)
+
+# The phrasings the agent's system message treats as document capability queries
+_CAPABILITY = re.compile(
+    r"\bwhat (documents|files|docs|sources|information|info|data|topics|subjects) (do|can|does) (you|i)\b"
+    r"|\bwhat (documents|files|docs|sources|information|info|data|topics|subjects)( are| is)? "
+    r"(available|covered|there|indexed|uploaded)\b"
+    r"|\bwhat (kinds?|sorts?|types?) of (documents|files|docs|information|info|data|questions|topics)\b"
+    r"|\b(list|show)( me)?( all)?( the| your)? (documents|files|docs|sources|topics)\b"
+    r"|\bwhat (can|could|do|should) (you|i) (know|help|do|ask|assist|search)\b"
+    r"|\bwhat'?s available\b|\bwhat is available\b|\bcapabilities\b"
+    r"|\bsummari[sz]e( all)?( of)?( the| your)? (documents|files|docs|sources|knowledge base)\b"
+    r"|\bwhich (documents|files|docs)\b"
+    r"|\b(available|uploaded|indexed) (documents|files|docs)\b",
+    re.IGNORECASE,
+)
+# "Which documents mention parking?" asks about content, not for the catalog
+_CONTENT_FILTER = re.compile(
+    r"\b(mention|mentions|mentioning|about|regarding|concerning|contain|contains|containing|cover|covers|"
+    r"covering|discuss|discusses|discussing|refer to|refers to|related to|say|says)\b",
+    re.IGNORECASE,
+)
+
+_QUESTION = re.compile(
+    r"^\s*(who|what|when|where|why|how|which|is|are|does|do|did|can|could|should|will|"
+    r"tell me|explain|describe|summari[sz]e|give me|find|search|look up)\b",
+    re.IGNORECASE,
+)
+
+# Messages that only make sense against earlier turns
+_FOLLOW_UP = re.compile(
+    r"^\s*(yes|yeah|yep|no|nope|ok|okay|sure|correct|right|that's right|go ahead|do it|"
+    r"confirm|confirmed|please do|cancel|stop)\b"
+    r"|\b(it|its|that|this|those|these|they|them|their|he|she|him|her|same|above|previous|"
+    r"earlier|instead|also|what about|and the)\b",
+    re.IGNORECASE,
+)
+
+
+def _awaiting_reply(history: Sequence[BaseMessage]) -> bool:
+    """True if the last assistant message asked the user something."""
+    for message in reversed(history):
+        if isinstance(message, AIMessage):
+            return str(message.content).rstrip().endswith("?")
+    return False
+
+
+def classify(question: str, history: Sequence[BaseMessage] = ()) -> Route:
+    """Keyword classification; Route(ROUTE_AGENT, intent=None) when the rules cannot decide."""
+    text = question.strip()
+    if not text:
+        return Route(ROUTE_AGENT, reason="empty")
+    if _awaiting_reply(history):
+        return Route(ROUTE_AGENT, reason="awaiting reply")
+    if history and _FOLLOW_UP.search(text):
+        return Route(ROUTE_AGENT, reason="follow-up")
+
+    filename_match = _FILENAME.search(text)
+    filename = filename_match.group(0) if filename_match else None
+    extension = filename_match.group(1).lower() if filename_match else None
+
+    is_excel = extension in ("xlsx", "xls", "csv") or (extension is None and bool(_EXCEL.search(text)))
+    is_text = extension in ("txt", "md") or (extension is None and bool(_TEXT.search(text)) and not is_excel)
+    if is_excel or is_text:
+        intent = EXCEL if is_excel else TEXT
+        if filename and _BARE_READ.match(text):
+            return Route(ROUTE_EXCEL_READ if is_excel else ROUTE_TEXT_READ, intent, "bare read", filename)
+        return Route(ROUTE_AGENT, intent, "file operation", filename)
+
+    if _CAPABILITY.search(text) and not _CONTENT_FILTER.search(text):
+        return Route(ROUTE_CAPABILITY, CAPABILITY, "capability keywords")
+    if _WRITE.search(text):
+        return Route(ROUTE_AGENT, reason="write verb without a file")
+    if _DATA.search(text):
+        return Route(ROUTE_AGENT, reason="may concern file data")
+    if _QUESTION.search(text) or text.endswith("?"):
+        return Route(ROUTE_DOCUMENTS, INFO, "question")
+    return Route(ROUTE_AGENT, reason="no rule matched")
+
+
+# === Embedding nearest-centroid model ===
+
+EXAMPLES: Dict[str, List[str]] = {
+    INFO: [
+        "When is trash pickup?",
+        "What are the school hours?",
+        "Summarize what jobs Jordan Whitmore is qualified for",
+        "Tell me about the parking rules downtown",
+        "How do I license my dog?",
+        "What does the constitution say about free speech?",
+        "Where is the nearest recycling center?",
+        "Explain the bus schedule on weekends",
+    ],
+    CAPABILITY: [
+        "What documents do you have?",
+        "Which files can you search?",
+        "What topics do you know about?",
+        "List the available documents",
+        "What kind of information can you help me with?",
+        "What can I ask you?",
+        "What topics are covered?",
+    ],
+    EXCEL: [
+        "Add a record where Matt sold Tom a boat for $500",
+        "Update the price of order 22 to 600",
+        "Delete the row for Bob in account info",
+        "Find all orders sold by Greg",
+        "Show me the order inventory spreadsheet",
+        "Change the buyer on order number 15",
+    ],
+    TEXT: [
+        "Add pickles to the cheeseburger recipe",
+        "Append a new line to my notes",
+        "Replace onions with mushrooms in the recipe file",
+        "Read the recipe text file",
+        "Write a shopping list to a text file",
+    ],
+}
+
+_INTENT_ROUTES = {INFO: ROUTE_DOCUMENTS, CAPABILITY: ROUTE_CAPABILITY, EXCEL: ROUTE_AGENT, TEXT: ROUTE_AGENT}
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+
+class IntentRouter:
+    def __init__(self, embeddings_factory: Optional[Callable[[], Embeddings]] = None,
+                 min_similarity: float = INTENT_ROUTER_MIN_SIMILARITY, margin: float = INTENT_ROUTER_MARGIN):
+        """
+        Args:
+            embeddings_factory: returns the Embeddings for the centroid model (called
+                once, off the event loop); None for keyword rules only
+        """
+        self._embeddings_factory = embeddings_factory
+        self.embeddings: Optional[Embeddings] = None
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self._intents: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._lock = asyncio.Lock()
+
+    async def _ensure_centroids(self) -> np.ndarray:
+        if self._centroids is None:
+            async with self._lock:
+                if self._centroids is None:
+                    self.embeddings = await asyncio.to_thread(self._embeddings_factory)
+                    intents = list(EXAMPLES)
+                    vectors = await self.embeddings.aembed_documents([e for i in intents for e in EXAMPLES[i]])
+                    matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+                    centroids, start = [], 0
+                    for intent in intents:
+                        count = len(EXAMPLES[intent])
+                        centroids.append(matrix[start:start + count].mean(axis=0))
+                        start += count
+                    self._intents = intents
+                    self._centroids = _normalize(np.stack(centroids))
+        return self._centroids
+
+    async def route(self, question: str, history: Sequence[BaseMessage] = ()) -> Route:
+        route = classify(question, history)
+        if route.route != ROUTE_AGENT or route.intent is not None or self._embeddings_factory is None:
+            return route
+        if route.reason != "no rule matched":
+            return route  # conversational, a change request or file data: the agent's job whatever it resembles
+        try:
+            centroids = await self._ensure_centroids()
+            embedding = await self.embeddings.aembed_query(question)
+        except Exception as e:
+            logger.warning(f"Intent centroids unavailable, using the agent: {e}")
+            return route
+        scores = centroids @ _normalize(np.asarray(embedding, dtype=np.float32))
+        best, runner_up = np.argsort(scores)[::-1][:2]
+        intent = self._intents[best]
+        reason = f"centroid {intent}={scores[best]:.2f} (next {scores[runner_up]:.2f})"
+        if scores[best] < self.min_similarity or scores[best] - scores[runner_up] < self.margin:
+            return Route(ROUTE_AGENT, reason=f"ambiguous: {reason}", embedding=embedding)
+        return Route(_INTENT_ROUTES[intent], intent, reason, embedding=embedding)
@@ -1,19 +1,66 @@
 # chatbot-server/main.py
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from chatbot_server.chains import run_chat_chain
+from chatbot_server.chains import run_chat_chain, stream_chat_chain, session_memory, ChatResult, ANSWERED
+from chatbot_server.db import init_pool, close_pool, check_health, fetch_history, history_writer
+from chatbot_server.vectorstore import warm_up_vectorstore
+from chatbot_server.tracing import start_request, span, record_tokens
+from chatbot_server.metrics import REQUEST_SECONDS, CHAT_FALLBACKS, CHAT_FALLBACK_AGENT_SECONDS
+from chatbot_server.ingest_jobs import create_job, find_duplicate, get_job
 from fastapi.middleware.cors import CORSMiddleware
-import psycopg2
+from contextlib import aclosing, asynccontextmanager
+from prometheus_client import make_asgi_app
 import os
-import shutil
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
 from dotenv import load_dotenv
-from openai import OpenAI
-from typing import List
+from openai import AsyncOpenAI
+from typing import AsyncIterator, List
 
 load_dotenv()
 
-app = FastAPI()
+# Return per-request span timings as a Server-Timing header (visible in browser dev tools)
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One connection pool per worker, shared by every request
+    await init_pool()
+    # Chat turns are written in batches off the response path
+    history_writer.start()
+    # Build the vector store up front so the first query only pays for the search
+    try:
+        await asyncio.to_thread(warm_up_vectorstore)
+    except Exception as e:
+        print(f"Vector store warm-up failed, it will be built on first use: {e}")
+    try:
+        yield
+    finally:
+        await history_writer.stop()
+        await close_pool()
+
+app = FastAPI(lifespan=lifespan)
+app.mount("/metrics", make_asgi_app())
+
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    """Open a trace for the request; spans recorded while handling it land in it."""
+    trace = start_request()
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    if route is not None:
+        # Route template, not the raw path, to keep label cardinality bounded
+        REQUEST_SECONDS.labels(route=route.path).observe(time.perf_counter() - start)
+    if SERVER_TIMING_ENABLED:
+        # Streaming responses only carry the spans finished before the headers went out
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
 
 # === CORS middleware ===
 app.add_middleware(
@@ -26,6 +73,7 @@ app.add_middleware(
 
 PDFS_DIR = "pdfs"
 os.makedirs(PDFS_DIR, exist_ok=True)
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1 << 20)))
 
 # === Request model ===
 class ChatRequest(BaseModel):
@@ -38,48 +86,152 @@ async def chat(request: ChatRequest):
     if request.question.startswith("[DIRECT_GPT_MODE]"):
         # Strip the prefix and use direct GPT
         clean_question = request.question.replace("[DIRECT_GPT_MODE]", "").strip()
-        response = query_openai_direct(clean_question)
+        response = await query_openai_direct(clean_question)
     else:
         # Use the enhanced RAG + Excel chain
-        response = run_chat_chain(request.question, session_id=request.session_id)
+        result = await run_chat_chain(request.question, session_id=request.session_id)
+        response = result.response
 
-    # Fallback to direct GPT if response is unhelpful
-    if is_unhelpful(response):
-        response = query_openai_direct(request.question)
+        # Fallback to direct GPT if the agent found no document context or failed
+        if result.outcome != ANSWERED:
+            _record_fallback(result)
+            try:
+                response = await query_openai_direct(request.question)
+            except Exception as e:
+                print(f"Direct GPT fallback failed for session '{request.session_id}': {e}")
 
-    store_chat(request.session_id, request.question, response)
+    await session_memory.save_turn(request.session_id, request.question, response)
     return {"response": response}
 
+def _record_fallback(result: ChatResult) -> None:
+    CHAT_FALLBACKS.labels(reason=result.outcome).inc()
+    CHAT_FALLBACK_AGENT_SECONDS.labels(reason=result.outcome).observe(result.seconds)
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _chat_event_stream(request: ChatRequest) -> AsyncIterator[str]:
+    response = ""
+    try:
+        if request.question.startswith("[DIRECT_GPT_MODE]"):
+            clean_question = request.question.replace("[DIRECT_GPT_MODE]", "").strip()
+            async for token in stream_openai_direct(clean_question):
+                response += token
+                yield _sse("token", {"token": token})
+            response = response.strip()
+        else:
+            # aclosing: a client disconnect closes the chain's stream too, which cancels its run
+            async with aclosing(stream_chat_chain(request.question, session_id=request.session_id)) as events:
+                async for event in events:
+                    if event["event"] == "final":
+                        result = ChatResult(**event["data"])
+                    else:
+                        yield _sse(event["event"], event["data"])
+            response = result.response
+
+            # Fallback to direct GPT if the agent found no document context or failed
+            if result.outcome != ANSWERED:
+                _record_fallback(result)
+                yield _sse("fallback", {"reason": result.outcome})
+                response = ""
+                async for token in stream_openai_direct(request.question):
+                    response += token
+                    yield _sse("token", {"token": token})
+                response = response.strip()
+
+        yield _sse("final", {"response": response})
+        await session_memory.save_turn(request.session_id, request.question, response)
+    except Exception as e:
+        print(f"Error streaming chat for session '{request.session_id}': {e}")
+        yield _sse("error", {"detail": str(e)})
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Same as /chat, but pushes tokens, tool activity and the final answer as Server-Sent Events."""
+    return StreamingResponse(
+        _chat_event_stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/health")
+async def health():
+    try:
+        return await check_health()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+
 @app.get("/history/{session_id}")
 async def get_history(session_id: str):
-    history = fetch_history(session_id)
+    history = await fetch_history(session_id)
     return {"history": history}
 
+def _finish_upload(tmp_path: str, file_path: str, content_hash: str) -> dict:
+    """
+    Skip a re-upload of a file that is already indexed and on disk with the
+    same content, otherwise move the upload into place and queue its ingest job (or join the
+    job already queued for this file and content).
+    """
+    source = os.path.abspath(file_path)
+    filename = os.path.basename(file_path)
+    if find_duplicate(source, content_hash):
+        os.unlink(tmp_path)
+        return {"status": "duplicate", "job_id": None, "duplicate_of": filename}
+    os.replace(tmp_path, file_path)
+    job_id, created = create_job(source, filename, content_hash)
+    if not created:
+        return {"status": "duplicate", "job_id": job_id, "duplicate_of": filename}
+    return {"status": "queued", "job_id": job_id}
+
+async def _save_upload(file: UploadFile, file_path: str) -> dict:
+    """
+    Stream an upload to a hidden temp file next to its target, hashing as it goes,
+    then hand it to _finish_upload. The watcher ignores hidden files, so it only
+    ever sees the complete file.
+    """
+    fd, tmp_path = await asyncio.to_thread(
+        tempfile.mkstemp, prefix=f".{os.path.basename(file_path)}.", suffix=".upload", dir=PDFS_DIR
+    )
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                digest.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+            await asyncio.to_thread(os.fsync, out.fileno())
+        return await asyncio.to_thread(_finish_upload, tmp_path, file_path, digest.hexdigest())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
 @app.post("/upload")
 async def upload_files(files: List[UploadFile] = File(...)):
     results = []
     success_count = 0
     for file in files:
-        safe_filename = os.path.basename(file.filename)
+        safe_filename = os.path.basename(file.filename or "")
         file_path = os.path.join(PDFS_DIR, safe_filename)
 
         try:
-            if not safe_filename:
+            if not safe_filename or safe_filename.startswith("."):
                 # This will be caught by the exception handler below
                 raise ValueError("Invalid filename provided")
 
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            results.append({"filename": safe_filename, "detail": "File uploaded successfully"})
+            saved = await _save_upload(file, file_path)
+            if saved["status"] == "duplicate":
+                detail = f"'{saved['duplicate_of']}' was already uploaded with identical content; upload skipped"
+            else:
+                detail = "File uploaded successfully; indexing queued"
+            results.append({"filename": safe_filename, "detail": detail, **saved})
             success_count += 1
         except Exception as e:
             error_message = f"Could not save file: {e}"
             print(f"Error saving file '{file.filename}': {error_message}")
             results.append({"filename": file.filename or "unknown", "error": error_message})
         finally:
-            if file:
-                file.file.close()
+            await file.close()
     
     if success_count == 0 and results:
         # If no files succeeded, return the first error as the detail in a 500 response
@@ -87,84 +239,46 @@ async def upload_files(files: List[UploadFile] = File(...)):
         
     return {"results": results}
 
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: int):
+    """Status of an upload's ingest job: queued, running, done (searchable) or failed."""
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingest job {job_id} not found")
+    return job
 
-# === Config ===
-MAX_HISTORY_PROMPTS = 20  # each prompt = 1 user + 1 bot entry
 
-DB_HOST = os.getenv("POSTGRES_HOST", "postgres")
-DB_PORT = os.getenv("POSTGRES_PORT", "5432")
-DB_NAME = os.getenv("POSTGRES_DB", "chatbot_db")
-DB_USER = os.getenv("POSTGRES_USER", "user")
-DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "securepass123")
+_openai_client = None
 
-def get_conn():
-    return psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT
-    )
+def get_openai_client() -> AsyncOpenAI:
+    """Shared async OpenAI client (created lazily so a missing key only fails on use)."""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _openai_client
 
-def store_chat(session_id: str, question: str, answer: str):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            # Insert both user and assistant messages
-            cur.execute(
-                """
-                INSERT INTO chat_history (session_id, role, answer)
-                VALUES (%s, %s, %s), (%s, %s, %s)
-                """,
-                (session_id, 'user', question, session_id, 'assistant', answer)
-            )
-
-            # Trim chat to keep only latest N pairs (2N rows)
-            cur.execute(
-                """
-                DELETE FROM chat_history
-                WHERE id NOT IN (
-                    SELECT id FROM (
-                        SELECT id FROM chat_history
-                        WHERE session_id = %s
-                        ORDER BY created_at DESC
-                        LIMIT %s
-                    ) AS latest
-                ) AND session_id = %s
-                """,
-                (session_id, MAX_HISTORY_PROMPTS * 2, session_id)
-            )
-
-def fetch_history(session_id: str):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT role, answer
-                FROM chat_history
-                WHERE session_id = %s
-                ORDER BY created_at ASC, id ASC
-                LIMIT %s
-                """,
-                (session_id, MAX_HISTORY_PROMPTS * 2)
-            )
-            return [{"role": r, "answer": a} for r, a in cur.fetchall()]
-
-def is_unhelpful(text: str) -> bool:
-    lowered = text.lower()
-    return any(phrase in lowered for phrase in [
-        "i'm sorry",
-        "not in the documents",
-        "do not contain information",
-        "would you like me to search",
-        "no specific question mentioned",
-        "need assistance with a specific topic"
-    ])
-
-def query_openai_direct(prompt: str) -> str:
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async def query_openai_direct(prompt: str) -> str:
     model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
-    completion = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}]
-    )
+    with span("openai.direct"):
+        completion = await get_openai_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    if completion.usage:
+        record_tokens(model, completion.usage.prompt_tokens, completion.usage.completion_tokens)
     return completion.choices[0].message.content.strip()
+
+async def stream_openai_direct(prompt: str) -> AsyncIterator[str]:
+    model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    with span("openai.direct"):
+        stream = await get_openai_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                record_tokens(model, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
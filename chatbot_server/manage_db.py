@@ -0,0 +1,155 @@
+"""
+Database management for the vector and chat history tables.
+
+    python -m chatbot_server.manage_db migrate [--index hnsw|ivfflat] [--dimensions 1536]
+                                                [--m 16] [--ef-construction 64] [--lists 100]
+    python -m chatbot_server.manage_db status
+
+`migrate` is idempotent and brings langchain_pg_embedding from the schema
+LangChain creates (json metadata, untyped vector, primary key only) to one
+that keeps retrieval and deletes sub-linear:
+
+ • cmetadata json → jsonb, with a GIN index (containment filters)
+ • expression index on cmetadata->>'source' (per-file deletes, filters, ingest diffs)
+ • index on collection_id
+ • GIN full-text index on to_tsvector('english', document) (hybrid retrieval)
+ • embedding vector → vector(<dimensions>)
+ • HNSW (default) or IVFFlat cosine index on embedding
+
+and gives chat_history the index every history query and trim walks,
+(session_id, id), built CONCURRENTLY so live chat writes are not blocked,
+plus a role check that admits the 'assistant' rows the app writes.
+
+Query-time recall/speed is tuned per connection with PGVECTOR_EF_SEARCH (HNSW)
+and PGVECTOR_IVFFLAT_PROBES (IVFFlat); see vectorstore.get_engine().
+"""
+
+import argparse
+from sqlalchemy import text
+
+from chatbot_server.vectorstore import get_engine
+from chatbot_server.retrieval import TS_CONFIG
+
+TABLE = "langchain_pg_embedding"
+HISTORY_TABLE = "chat_history"
+HNSW_INDEX = "ix_langchain_pg_embedding_embedding_hnsw"
+IVFFLAT_INDEX = "ix_langchain_pg_embedding_embedding_ivfflat"
+DEFAULT_DIMENSIONS = 1536   # text-embedding-ada-002 / text-embedding-3-small
+
+
+def _column_type(conn, column: str) -> str:
+    return conn.execute(
+        text("""
+            SELECT format_type(a.atttypid, a.atttypmod)
+            FROM pg_attribute a
+            WHERE a.attrelid = CAST(:t AS regclass) AND a.attname = :c AND NOT a.attisdropped
+        """),
+        {"t": TABLE, "c": column},
+    ).scalar_one()
+
+
+def _step(conn, description: str, sql: str) -> None:
+    print(f"🔧  {description}")
+    conn.execute(text(sql))
+
+
+def migrate(index: str, dimensions: int, m: int, ef_construction: int, lists: int) -> None:
+    # DDL runs statement by statement, so a long index build does not hold earlier locks
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if _column_type(conn, "cmetadata") != "jsonb":
+            _step(conn, "Converting cmetadata to jsonb",
+                  f"ALTER TABLE {TABLE} ALTER COLUMN cmetadata TYPE jsonb USING cmetadata::jsonb")
+
+        _step(conn, "GIN index on cmetadata",
+              f"CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_cmetadata_gin "
+              f"ON {TABLE} USING gin (cmetadata jsonb_path_ops)")
+        _step(conn, "Expression index on cmetadata->>'source'",
+              f"CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_source "
+              f"ON {TABLE} ((cmetadata->>'source'))")
+        _step(conn, "Index on collection_id",
+              f"CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_collection_id "
+              f"ON {TABLE} (collection_id)")
+        _step(conn, "Full-text index on document",
+              f"CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_document_fts "
+              f"ON {TABLE} USING gin (to_tsvector('{TS_CONFIG}', document))")
+
+        vector_type = f"vector({dimensions})"
+        if _column_type(conn, "embedding") != vector_type:
+            bad = conn.execute(
+                text(f"SELECT count(*) FROM {TABLE} WHERE vector_dims(embedding) <> :d"), {"d": dimensions}
+            ).scalar_one()
+            if bad:
+                raise SystemExit(f"❌  {bad} embeddings are not {dimensions}-dimensional; "
+                                 f"re-ingest them or pass --dimensions.")
+            _step(conn, f"Fixing embedding column type to {vector_type}",
+                  f"ALTER TABLE {TABLE} ALTER COLUMN embedding TYPE {vector_type}")
+
+        # PGVector's default distance strategy is cosine (<=>)
+        if index == "hnsw":
+            _step(conn, "Dropping IVFFlat index (switching to HNSW)", f"DROP INDEX IF EXISTS {IVFFLAT_INDEX}")
+            _step(conn, f"HNSW index on embedding (m={m}, ef_construction={ef_construction})",
+                  f"CREATE INDEX IF NOT EXISTS {HNSW_INDEX} ON {TABLE} "
+                  f"USING hnsw (embedding vector_cosine_ops) WITH (m = {m}, ef_construction = {ef_construction})")
+        else:
+            _step(conn, "Dropping HNSW index (switching to IVFFlat)", f"DROP INDEX IF EXISTS {HNSW_INDEX}")
+            _step(conn, f"IVFFlat index on embedding (lists={lists})",
+                  f"CREATE INDEX IF NOT EXISTS {IVFFLAT_INDEX} ON {TABLE} "
+                  f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {lists})")
+
+        _step(conn, "Analyzing table", f"ANALYZE {TABLE}")
+
+        _step(conn, "Index on chat_history (session_id, id)",
+              f"CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_history_session_id_idx "
+              f"ON {HISTORY_TABLE} (session_id, id)")
+        _step(conn, "Allowing role 'assistant' in chat_history",
+              f"ALTER TABLE {HISTORY_TABLE} DROP CONSTRAINT IF EXISTS chat_history_role_check")
+        conn.execute(text(
+            f"ALTER TABLE {HISTORY_TABLE} ADD CONSTRAINT chat_history_role_check "
+            f"CHECK (role IN ('user', 'assistant', 'bot')) NOT VALID"
+        ))
+        conn.execute(text(f"ALTER TABLE {HISTORY_TABLE} VALIDATE CONSTRAINT chat_history_role_check"))
+        _step(conn, "Analyzing chat_history", f"ANALYZE {HISTORY_TABLE}")
+    print("🎉  Migration complete.")
+
+
+def status() -> None:
+    with get_engine().connect() as conn:
+        print(f"cmetadata: {_column_type(conn, 'cmetadata')}")
+        print(f"embedding: {_column_type(conn, 'embedding')}")
+        rows = conn.execute(
+            text("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = :t ORDER BY indexname"),
+            {"t": TABLE},
+        ).all()
+        for name, definition in rows:
+            print(f"  {name}: {definition}")
+        rows = conn.execute(
+            text("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = :t ORDER BY indexname"),
+            {"t": HISTORY_TABLE},
+        ).all()
+        print(f"{HISTORY_TABLE}: {conn.execute(text(f'SELECT count(*) FROM {HISTORY_TABLE}')).scalar_one()} rows")
+        for name, definition in rows:
+            print(f"  {name}: {definition}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the chatbot vector tables")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    m = sub.add_parser("migrate", help="convert metadata to jsonb and build indexes")
+    m.add_argument("--index", choices=["hnsw", "ivfflat"], default="hnsw")
+    m.add_argument("--dimensions", type=int, default=DEFAULT_DIMENSIONS)
+    m.add_argument("--m", type=int, default=16, help="HNSW: links per node")
+    m.add_argument("--ef-construction", type=int, default=64, help="HNSW: build-time candidate list size")
+    m.add_argument("--lists", type=int, default=100, help="IVFFlat: number of lists (≈ rows / 1000)")
+
+    sub.add_parser("status", help="show column types and indexes")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrate(args.index, args.dimensions, args.m, args.ef_construction, args.lists)
+    else:
+        status()
+
+
+if __name__ == "__main__":
+    main()
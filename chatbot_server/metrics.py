@@ -0,0 +1,104 @@
+# chatbot-server/metrics.py
+
+"""
+Prometheus metrics shared by the chatbot server.
+
+Metrics are defined once here and updated from the modules that own the
+measured resource. main.py exposes them on /metrics.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# === Chat history connection pool ===
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    "chatbot_db_pool_acquire_seconds",
+    "Time spent waiting for a chat history connection from the pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_POOL_CONNECTIONS_OPEN = Gauge(
+    "chatbot_db_pool_connections_open",
+    "Connections currently open in the chat history pool",
+)
+DB_POOL_CONNECTIONS_IN_USE = Gauge(
+    "chatbot_db_pool_connections_in_use",
+    "Connections currently checked out of the chat history pool",
+)
+DB_POOL_CONNECTIONS_MAX = Gauge(
+    "chatbot_db_pool_connections_max",
+    "Configured maximum size of the chat history pool",
+)
+
+# === Document watcher (synced_ingest) ===
+WATCHER_QUEUE_DEPTH = Gauge(
+    "chatbot_watcher_queue_depth",
+    "Paths waiting in the ingest queue (after coalescing)",
+)
+WATCHER_QUEUE_LAG_SECONDS = Gauge(
+    "chatbot_watcher_queue_lag_seconds",
+    "Age of the oldest pending file event",
+)
+WATCHER_EVENT_LAG_SECONDS = Histogram(
+    "chatbot_watcher_event_lag_seconds",
+    "Time from the first file event for a path to the start of its processing",
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600),
+)
+WATCHER_JOB_SECONDS = Histogram(
+    "chatbot_watcher_job_seconds",
+    "Time spent ingesting or deleting one file",
+    ["action"],
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300),
+)
+WATCHER_JOBS = Counter(
+    "chatbot_watcher_jobs_total",
+    "Files processed by the watcher",
+    ["action", "result"],
+)
+WATCHER_EVENTS_COALESCED = Counter(
+    "chatbot_watcher_events_coalesced_total",
+    "File events merged into an already pending job for the same path",
+)
+
+# === Chat requests ===
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_seconds",
+    "HTTP request latency by route (streaming routes: time to response headers)",
+    ["route"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+SPAN_SECONDS = Histogram(
+    "chatbot_span_seconds",
+    "Time spent in one instrumented step of a request (agent, llm, rag.*, tool.*, db.*, openai.*)",
+    ["span"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+LLM_TOKENS = Counter(
+    "chatbot_llm_tokens_total",
+    "Tokens sent to and received from OpenAI chat models",
+    ["model", "kind"],
+)
+CHAT_OUTCOMES = Counter(
+    "chatbot_chat_outcomes_total",
+    "Chat runs (agent or direct route) by outcome (answered, no_context, error)",
+    ["outcome"],
+)
+CHAT_ROUTES = Counter(
+    "chatbot_chat_routes_total",
+    "Chat requests by pre-routing decision (agent, documents, capability, excel_read, text_read)",
+    ["route"],
+)
+CHAT_FALLBACKS = Counter(
+    "chatbot_chat_fallbacks_total",
+    "Chat requests answered by direct GPT after the agent gave up",
+    ["reason"],
+)
+CHAT_FALLBACK_AGENT_SECONDS = Histogram(
+    "chatbot_chat_fallback_agent_seconds",
+    "Agent time spent before a fallback to direct GPT (the direct call itself is span openai.direct)",
+    ["reason"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+CACHE_LOOKUPS = Counter(
+    "chatbot_cache_lookups_total",
+    "Cache lookups by cache and outcome",
+    ["cache", "result"],
+)
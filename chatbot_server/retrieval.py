@@ -0,0 +1,110 @@
+# chatbot-server/retrieval.py
+
+"""
+Hybrid retrieval for rag_search_tool.
+
+Vector search alone misses exact tokens (order numbers, part numbers, article
+numbers), so each query also runs a Postgres full-text search over the chunk
+text. The two ranked lists are merged with reciprocal rank fusion:
+
+    score(chunk) = Σ 1 / (RRF_K + rank_in_list)
+
+A chunk ranked first by either retriever lands at or near the top, so the exact
+match is found without widening k. The lexical side is served by the
+to_tsvector GIN index created by `manage_db migrate`.
+
+Top-k search always returns k chunks from a non-empty corpus, relevant or not.
+Vector candidates farther than RETRIEVAL_MAX_DISTANCE (cosine distance) from
+the query are dropped, and when none is left the search returns nothing: the
+caller treats that as "no context" before spending any LLM call. Lexical
+matches only re-rank what passes; a query word appearing somewhere is not
+evidence of relevance on its own.
+"""
+
+import os
+import asyncio
+import logging
+from typing import Dict, List, Sequence
+
+from langchain_community.vectorstores import PGVector
+from langchain_core.documents import Document
+from sqlalchemy import text
+
+from chatbot_server.vectorstore import get_engine, get_collection_id, chunk_fingerprint
+
+logger = logging.getLogger(__name__)
+
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))  # fetched from each retriever
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Suits text-embedding-ada-002 (OpenAIEmbeddings' default), where even unrelated
+# texts are ~0.25-0.3 apart; ~0.6 for the text-embedding-3 models. 0 disables the cutoff.
+RETRIEVAL_MAX_DISTANCE = float(os.getenv("RETRIEVAL_MAX_DISTANCE", "0.25"))
+
+# Must match the expression index in manage_db.py for the planner to use it
+TS_CONFIG = "english"
+
+
+def lexical_search(query: str, k: int) -> List[Document]:
+    """Full-text search over chunk text; any query term may match, ranked by ts_rank_cd."""
+    with get_engine().connect() as conn:
+        rows = conn.execute(
+            text(f"""
+                SELECT e.document, e.cmetadata
+                FROM langchain_pg_embedding e,
+                     CAST(replace(CAST(plainto_tsquery('{TS_CONFIG}', :q) AS text), ' & ', ' | ') AS tsquery) q
+                WHERE e.collection_id = :c
+                  AND to_tsvector('{TS_CONFIG}', e.document) @@ q
+                ORDER BY ts_rank_cd(to_tsvector('{TS_CONFIG}', e.document), q) DESC
+                LIMIT :k
+            """),
+            {"q": query, "c": get_collection_id(conn), "k": k},
+        ).all()
+    return [Document(page_content=document, metadata=metadata or {}) for document, metadata in rows]
+
+
+def rrf_fuse(result_lists: Sequence[Sequence[Document]], k: int) -> List[Document]:
+    """Merge ranked lists by reciprocal rank fusion, deduplicating chunks by content hash."""
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = chunk_fingerprint(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked[:k]]
+
+
+def vector_search(vectorstore: PGVector, query_embedding: List[float], k: int) -> List[Document]:
+    """Nearest chunks, without those beyond RETRIEVAL_MAX_DISTANCE."""
+    scored = vectorstore.similarity_search_with_score_by_vector(query_embedding, k=k)
+    if RETRIEVAL_MAX_DISTANCE <= 0:
+        return [doc for doc, _ in scored]
+    relevant = [doc for doc, distance in scored if distance <= RETRIEVAL_MAX_DISTANCE]
+    if scored and not relevant:
+        logger.info(f"No chunk within distance {RETRIEVAL_MAX_DISTANCE} (nearest {scored[0][1]:.3f})")
+    return relevant
+
+
+async def hybrid_search(vectorstore: PGVector, query: str, query_embedding: List[float],
+                        k: int = 5) -> List[Document]:
+    """Vector and lexical search run concurrently, fused to the top k chunks; [] if nothing is relevant."""
+    if not HYBRID_SEARCH_ENABLED:
+        return await asyncio.to_thread(vector_search, vectorstore, query_embedding, k)
+
+    candidates = max(k, HYBRID_CANDIDATES)
+    vector_docs, lexical_docs = await asyncio.gather(
+        asyncio.to_thread(vector_search, vectorstore, query_embedding, candidates),
+        asyncio.to_thread(lexical_search, query, candidates),
+        return_exceptions=True,
+    )
+    if isinstance(vector_docs, BaseException):
+        raise vector_docs
+    if not vector_docs:
+        return []
+    if isinstance(lexical_docs, BaseException):
+        # Lexical search only improves ranking; never fail retrieval over it
+        logger.warning(f"Lexical search failed, using vector results only: {lexical_docs}")
+        return list(vector_docs[:k])
+    return rrf_fuse([vector_docs, lexical_docs], k)
@@ -0,0 +1,145 @@
+# chatbot-server/session_memory.py
+
+"""
+Per-session conversation memory backed by the chat_history table.
+
+chat_history is the source of truth, so any uvicorn worker can serve any
+session: a session seen for the first time is rehydrated from its latest rows,
+and a cached session picks up turns other workers wrote (rows with a higher id)
+before each run. Locally:
+
+  • sessions are kept in an LRU, capped at SESSION_MEMORY_MAX_SESSIONS and
+    dropped after SESSION_MEMORY_IDLE_TTL seconds without a request
+  • each session holds a ConversationTokenBufferMemory, so only the most
+    recent SESSION_MEMORY_MAX_TOKENS tokens of conversation go to the LLM
+
+Turns are written with save_turn() once the final response is known (after any
+fallback), never by the agent itself, so memory matches what the user saw. The
+turn goes into the cached memory at once while the database write completes in
+the background (db.HistoryWriter); the session's next load() waits for it.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+from langchain.memory import ConversationTokenBufferMemory
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chatbot_server.db import fetch_history_rows, store_chat
+
+logger = logging.getLogger(__name__)
+
+SESSION_MEMORY_MAX_SESSIONS = int(os.getenv("SESSION_MEMORY_MAX_SESSIONS", "1000"))
+SESSION_MEMORY_IDLE_TTL = int(os.getenv("SESSION_MEMORY_IDLE_TTL", "1800"))  # seconds
+SESSION_MEMORY_MAX_TOKENS = int(os.getenv("SESSION_MEMORY_MAX_TOKENS", "2000"))
+
+
+@dataclass
+class _Session:
+    memory: ConversationTokenBufferMemory
+    last_id: int = 0  # highest chat_history id synced from the table
+    saved_ids: set = field(default_factory=set)  # ids above last_id already added by save_turn()
+    last_used: float = field(default_factory=time.monotonic)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    pending: List[asyncio.Task] = field(default_factory=list)  # store_chat() calls not yet finished
+
+
+class SessionMemoryStore:
+    def __init__(self, llm: BaseLanguageModel, max_sessions: int = SESSION_MEMORY_MAX_SESSIONS,
+                 idle_ttl: int = SESSION_MEMORY_IDLE_TTL, max_tokens: int = SESSION_MEMORY_MAX_TOKENS):
+        self.llm = llm  # used for token counting only
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_tokens = max_tokens
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    async def load(self, session_id: str) -> ConversationTokenBufferMemory:
+        """Memory for a session, rehydrated or brought up to date from chat_history."""
+        session = self._touch(session_id)
+        async with session.lock:
+            if session.pending:
+                # Our own writes must land (and their ids be known) before syncing past them
+                await asyncio.gather(*session.pending, return_exceptions=True)
+            try:
+                rows = await fetch_history_rows(session_id, after_id=session.last_id)
+            except Exception as e:
+                # Without the database the agent still answers, just without earlier turns
+                logger.warning(f"Could not load history for session {session_id}: {e}")
+                rows = []
+            if rows:
+                self._append(session, [(r["role"], r["answer"]) for r in rows if r["id"] not in session.saved_ids])
+                session.last_id = rows[-1]["id"]
+                session.saved_ids = {i for i in session.saved_ids if i > session.last_id}
+        return session.memory
+
+    async def save_turn(self, session_id: str, question: str, answer: str) -> None:
+        """Add one question/answer pair to the cached session and persist it in the background."""
+        write = asyncio.ensure_future(store_chat(session_id, question, answer))
+        session = self._sessions.get(session_id)  # None if evicted meanwhile; rehydrated on next use
+        if session is not None:
+            session.pending.append(write)
+        write.add_done_callback(lambda task: self._saved(session_id, session, task))
+        if session is None:
+            return
+        async with session.lock:
+            # Rows other workers wrote in between are still picked up by the next load()
+            self._append(session, [("user", question), ("assistant", answer)])
+
+    @staticmethod
+    def _saved(session_id: str, session: Optional[_Session], task: asyncio.Task) -> None:
+        if session is not None:
+            session.pending.remove(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error(f"Could not store chat turn for session {session_id}: {task.exception()}")
+        elif session is not None:
+            session.saved_ids.update(task.result())
+
+    def _touch(self, session_id: str) -> _Session:
+        now = time.monotonic()
+        # The OrderedDict is in last-used order, so idle sessions sit at the front
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_used <= self.idle_ttl:
+                break
+            del self._sessions[oldest_id]
+
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = _Session(memory=ConversationTokenBufferMemory(
+                llm=self.llm,
+                max_token_limit=self.max_tokens,
+                memory_key="chat_history",
+                return_messages=True,
+            ))
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                logger.debug(f"Evicted session memory {evicted_id}")
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_used = now
+        return session
+
+    def _append(self, session: _Session, turns: Sequence[tuple]) -> None:
+        chat_memory = session.memory.chat_memory
+        for role, content in turns:
+            # Older rows were written with role 'bot'
+            chat_memory.add_message(HumanMessage(content=content) if role == "user" else AIMessage(content=content))
+        # Same pruning ConversationTokenBufferMemory applies in save_context()
+        buffer = chat_memory.messages
+        while buffer and self.llm.get_num_tokens_from_messages(buffer) > self.max_tokens:
+            buffer.pop(0)
@@ -1,6 +1,8 @@
 
 import os
 from typing import List
+from chatbot_server.file_locks import atomic_write, file_lock
+from chatbot_server.tool_output import format_text
 
 # Define the base directory for text files (Docker container path)
 TEXT_FILES_DIR = "/app/pdfs"
@@ -14,20 +16,28 @@ def _get_text_file_path(filename: str) -> str:
     # Otherwise, construct path relative to the text files directory
     return os.path.join(TEXT_FILES_DIR, filename)
 
-def read_text_file(file_path: str) -> str:
+def load_text_file(file_path: str) -> str:
+    """Full content of a text file, read under a shared lock; raises if it cannot be read."""
+    full_path = _get_text_file_path(file_path)
+    with file_lock(full_path, exclusive=False):
+        with open(full_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+def read_text_file(file_path: str, start_line: int = 1) -> str:
     """
-    Reads the content of a text file.
+    Reads a page of a text file.
 
     Args:
         file_path (str): The path to the text file.
+        start_line (int): 1-based line to start from.
 
     Returns:
-        str: The content of the file, or an error message if the file cannot be read.
+        str: As many lines as fit the tool output budget, with a line-range
+            summary and the start_line of the next page, or an error message
+            if the file cannot be read.
     """
     try:
-        full_path = _get_text_file_path(file_path)
-        with open(full_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        return format_text(load_text_file(file_path), start_line, title=file_path)
     except Exception as e:
         return f"Error reading file: {e}"
 
@@ -44,12 +54,13 @@ def write_to_text_file(file_path: str, content: str) -> str:
     """
     try:
         full_path = _get_text_file_path(file_path)
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        with file_lock(full_path):
+            # Temp file + rename: a crash leaves the old content, never a truncated file
+            atomic_write(full_path, content)
         
-        # Verify the write was successful by reading back the content
-        with open(full_path, 'r', encoding='utf-8') as f:
-            written_content = f.read()
+            # Verify the write was successful by reading back the content
+            with open(full_path, 'r', encoding='utf-8') as f:
+                written_content = f.read()
         
         if written_content == content:
             return f"Successfully wrote to {file_path} (verified: {len(content)} characters)"
@@ -73,19 +84,19 @@ def append_to_text_file(file_path: str, content: str) -> str:
     try:
         full_path = _get_text_file_path(file_path)
         
-        # Read original content first
-        original_content = ""
-        if os.path.exists(full_path):
+        with file_lock(full_path):
+            # Read original content first
+            original_content = ""
+            if os.path.exists(full_path):
+                with open(full_path, 'r', encoding='utf-8') as f:
+                    original_content = f.read()
+            
+            # Append by rewriting: a crash mid-write leaves the old file, never a torn one
+            atomic_write(full_path, original_content + content)
+
+            # Verify the append was successful
             with open(full_path, 'r', encoding='utf-8') as f:
-                original_content = f.read()
-        
-        # Append the new content
-        with open(full_path, 'a', encoding='utf-8') as f:
-            f.write(content)
-        
-        # Verify the append was successful
-        with open(full_path, 'r', encoding='utf-8') as f:
-            new_content = f.read()
+                new_content = f.read()
         
         expected_content = original_content + content
         if new_content == expected_content:
@@ -114,21 +125,22 @@ def replace_in_text_file(file_path: str, old_string: str, new_string: str) -> st
         if not os.path.exists(full_path):
             return f"Error: File {file_path} does not exist"
         
-        with open(full_path, 'r', encoding='utf-8') as f:
-            file_content = f.read()
-        
-        replacements_count = file_content.count(old_string)
-        if replacements_count == 0:
-            return f"The string '{old_string}' was not found in {file_path}. No changes made."
+        # Held across read-modify-write so a concurrent edit cannot be lost
+        with file_lock(full_path):
+            with open(full_path, 'r', encoding='utf-8') as f:
+                file_content = f.read()
+            
+            replacements_count = file_content.count(old_string)
+            if replacements_count == 0:
+                return f"The string '{old_string}' was not found in {file_path}. No changes made."
 
-        new_content = file_content.replace(old_string, new_string)
-        
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(new_content)
-        
-        # Verify the replacement was successful
-        with open(full_path, 'r', encoding='utf-8') as f:
-            written_content = f.read()
+            new_content = file_content.replace(old_string, new_string)
+            
+            atomic_write(full_path, new_content)
+            
+            # Verify the replacement was successful
+            with open(full_path, 'r', encoding='utf-8') as f:
+                written_content = f.read()
         
         if written_content == new_content:
             return f"Successfully replaced {replacements_count} instance(s) of '{old_string}' with '{new_string}' in {file_path} (verified)"
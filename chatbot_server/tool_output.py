@@ -0,0 +1,115 @@
+# chatbot-server/tool_output.py
+
+"""
+Compact, paginated tool outputs for the agent.
+
+Everything a tool returns lands in the agent scratchpad and is re-sent on every
+later iteration, so outputs here are:
+
+  • tabular data as TSV (one header line, one line per row, no JSON keys
+    repeated per row, no indentation)
+  • cut to a token budget (TOOL_OUTPUT_MAX_TOKENS) on a row/line boundary
+  • prefixed with a one-line summary (what was shown out of how much) and
+    followed by the offset to pass to get the next page
+"""
+
+import os
+import logging
+from typing import Any, Dict, Iterable, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+TOOL_OUTPUT_MAX_TOKENS = int(os.getenv("TOOL_OUTPUT_MAX_TOKENS", "1500"))
+# Cells longer than this are cut (long free-text columns would eat the budget)
+MAX_CELL_CHARS = 200
+
+_encoding = None
+_encoding_failed = False
+
+
+def count_tokens(text: str) -> int:
+    """cl100k token count; a chars/4 estimate if tiktoken's encoding is unavailable."""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, estimating tool output tokens: {e}")
+            _encoding_failed = True
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    text = str(value).replace("\t", " ").replace("\r", " ").replace("\n", " ")
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS] + "…"
+
+
+def _fit(lines: Iterable[str], budget: int) -> List[str]:
+    """Leading lines that fit in `budget` tokens (at least one)."""
+    kept: List[str] = []
+    used = 0
+    for line in lines:
+        cost = count_tokens(line) + 1
+        if kept and used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+
+def format_table(records: Sequence[Dict[str, Any]], columns: Sequence[str], total: int,
+                 offset: int = 0, title: str = "", max_tokens: int = TOOL_OUTPUT_MAX_TOKENS,
+                 paged: bool = True) -> str:
+    """
+    One page of rows as TSV.
+
+    `records` are the rows from `offset` on (already limited by the caller);
+    `total` is the number of rows available overall. With paged=False no
+    next-offset hint is added (the tool has no offset argument).
+    """
+    header = "\t".join(_cell(c) for c in columns)
+    budget = max_tokens - count_tokens(header) - 40  # leave room for the summary lines
+    rows = _fit(("\t".join(_cell(r.get(c)) for c in columns) for r in records), budget)
+
+    shown = len(rows)
+    end = offset + shown
+    summary = f"{title}: " if title else ""
+    summary += f"rows {offset}-{end - 1} of {total}" if shown else f"no rows at offset {offset} (total {total})"
+    parts = [summary, header, *rows]
+    if paged and end < total:
+        parts.append(f"[{total - end} more rows: call again with offset={end}]")
+    return "\n".join(parts)
+
+
+def format_text(content: str, start_line: int = 1, title: str = "",
+                max_tokens: int = TOOL_OUTPUT_MAX_TOKENS) -> str:
+    """A token-budgeted page of a text file, starting at 1-based `start_line`."""
+    lines = content.splitlines()
+    total = len(lines)
+    start = max(1, start_line)
+    page = _fit(lines[start - 1:], max_tokens - 40) if start <= total else []
+    end = start + len(page) - 1
+
+    summary = f"{title}: " if title else ""
+    summary += f"lines {start}-{end} of {total}" if page else f"no lines from {start} (total {total})"
+    parts = [summary, *page]
+    if end < total and page:
+        parts.append(f"[{total - end} more lines: call again with start_line={end + 1}]")
+    return "\n".join(parts)
+
+
+def format_schema(info: Dict[str, Any], sample_rows: int = 2, max_tokens: int = TOOL_OUTPUT_MAX_TOKENS) -> str:
+    """Sheet names, row counts, columns and a couple of sample rows per sheet."""
+    parts: List[str] = [f"{info['filename']}: sheets {', '.join(info['sheets'])}"]
+    per_sheet = max_tokens // max(1, len(info["sheet_info"]))
+    for sheet, sheet_info in info["sheet_info"].items():
+        columns = sheet_info["columns"]
+        samples = sheet_info.get("sample_data", [])[:sample_rows]
+        parts.append(format_table(samples, columns, sheet_info["rows"], title=f"sheet {sheet} sample",
+                                  max_tokens=per_sheet, paged=False))
+    return "\n".join(parts)
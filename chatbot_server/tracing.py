@@ -0,0 +1,230 @@
+# chatbot-server/tracing.py
+
+"""
+Per-request tracing.
+
+Two layers:
+  • spans — span()/record_span() time one step (agent run, LLM call, RAG phase,
+    tool, database write) into the chatbot_span_seconds histogram and, when a
+    request trace is active, into that request's RequestTrace. The trace lives
+    in a contextvar set by the HTTP middleware, so tasks and tool threads
+    spawned by the request report into it without passing it around; main.py
+    can return it as a Server-Timing header.
+  • TraceCollector — a LangChain callback handler created per agent run. It
+    records one small dict per step (LLM call, agent action, tool call, error)
+    instead of capturing the verbose stdout transcript, so concurrent requests
+    never interleave and nothing is formatted unless it is logged. Tools the
+    run calls can add their own steps with record_step().
+
+Token usage and cache hit counters are recorded the same way.
+"""
+
+import json
+import time
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from chatbot_server.metrics import CACHE_LOOKUPS, LLM_TOKENS, SPAN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+# === Request traces and spans ===
+
+class RequestTrace:
+    """Spans, token counts and cache outcomes of one HTTP request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[tuple] = []  # (name, seconds); appended from tasks and tool threads
+        self.tokens: Dict[str, int] = defaultdict(int)
+        self.cache: Dict[str, int] = defaultdict(int)
+
+    def totals(self) -> Dict[str, float]:
+        """Total seconds per span name, in first-seen order."""
+        totals: Dict[str, float] = {}
+        for name, seconds in list(self.spans):
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: total per span name plus the whole request."""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.totals().items()]
+        entries += [f"tokens.{kind};desc={count}" for kind, count in self.tokens.items()]
+        entries += [f"cache.{key};desc={count}" for key, count in self.cache.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("chatbot_request_trace", default=None)
+
+
+def start_request() -> RequestTrace:
+    """Begin a trace for the current request (called by the HTTP middleware)."""
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+def record_span(name: str, seconds: float) -> None:
+    SPAN_SECONDS.labels(span=name).observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append((name, seconds))
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block (sync or async code) as one span."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def record_tokens(model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    LLM_TOKENS.labels(model=model, kind="prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(model=model, kind="completion").inc(completion_tokens)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tokens["prompt"] += prompt_tokens
+        trace.tokens["completion"] += completion_tokens
+
+
+def record_cache(cache: str, result: str, count: int = 1) -> None:
+    if count <= 0:
+        return
+    CACHE_LOOKUPS.labels(cache=cache, result=result).inc(count)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.cache[f"{cache}.{result}"] += count
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Attached to a chat model so every call through it reports its token usage."""
+
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+        if not (prompt_tokens or completion_tokens):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        if prompt_tokens or completion_tokens:
+            record_tokens(self.model, prompt_tokens, completion_tokens)
+
+
+# === Agent run traces ===
+
+# Tool inputs/outputs are truncated to this many characters in the trace
+MAX_FIELD_CHARS = 200
+
+
+def _short(value: Any) -> str:
+    text = str(value)
+    return text if len(text) <= MAX_FIELD_CHARS else text[:MAX_FIELD_CHARS] + "…"
+
+
+_current_collector: ContextVar[Optional["TraceCollector"]] = ContextVar("chatbot_agent_trace", default=None)
+
+
+def record_step(event: str, **fields: Any) -> None:
+    """Add a step to the agent run traced in the current context (called from inside tools)."""
+    collector = _current_collector.get()
+    if collector is not None:
+        collector._record(event, **fields)
+
+
+class TraceCollector(BaseCallbackHandler):
+    """Collects the steps of one agent run as structured events."""
+
+    # Appending to a list is cheap; no need to hop through a thread
+    run_inline = True
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.started = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self._open: Dict[UUID, float] = {}  # run_id -> start time of in-flight LLM/tool calls
+        # The run's tools execute in this context (or a copy of it) and report through record_step()
+        _current_collector.set(self)
+
+    def _record(self, event: str, **fields: Any) -> None:
+        self.events.append({"event": event, "at": round(time.perf_counter() - self.started, 3), **fields})
+
+    def _elapsed(self, run_id: UUID, span_name: Optional[str] = None) -> Optional[float]:
+        start = self._open.pop(run_id, None)
+        if start is None:
+            return None
+        seconds = time.perf_counter() - start
+        if span_name:
+            record_span(span_name, seconds)
+        return round(seconds, 3)
+
+    # --- LLM ---
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs) -> None:
+        self._open[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs) -> None:
+        self._open[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self._record("llm", seconds=self._elapsed(run_id, "llm"), tokens=usage.get("total_tokens"))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._record("llm_error", seconds=self._elapsed(run_id), error=_short(error))
+
+    # --- Agent ---
+    def on_agent_action(self, action: AgentAction, **kwargs) -> None:
+        self._record("action", tool=action.tool, input=_short(action.tool_input))
+
+    def on_agent_finish(self, finish: AgentFinish, **kwargs) -> None:
+        self._record("finish")
+
+    # --- Tools ---
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs) -> None:
+        self._open[run_id] = time.perf_counter()
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs) -> None:
+        self._record("tool", tool=kwargs.get("name"), seconds=self._elapsed(run_id, f"tool.{kwargs.get('name')}"),
+                     output=_short(output))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._record("tool_error", tool=kwargs.get("name"), seconds=self._elapsed(run_id, f"tool.{kwargs.get('name')}"),
+                     error=_short(error))
+
+    # --- Summary ---
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "seconds": round(time.perf_counter() - self.started, 3),
+            "llm_calls": sum(1 for e in self.events if e["event"] == "llm"),
+            "tools": [e["tool"] for e in self.events if e["event"] == "action"],
+            "errors": sum(1 for e in self.events if e["event"].endswith("_error")),
+            "no_context": sum(1 for e in self.events if e["event"] == "no_context"),
+        }
+
+    def log(self) -> None:
+        """One INFO line per run; the full step list at DEBUG."""
+        logger.info(f"Agent trace: {json.dumps(self.summary())}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Agent trace steps: {json.dumps(self.events, default=str)}")